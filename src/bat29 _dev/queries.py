@@ -1,8 +1,11 @@
 import os
+import csv
+import io
 import json
 import re
 import datetime
-from sqlalchemy import create_engine, exists, func
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, exists, func, insert, bindparam, type_coerce, String
 from sqlalchemy.orm import sessionmaker
 # Assuming sqlalchemy_models_working defines the necessary Base and table models
 # Adjust the import path if necessary
@@ -10,6 +13,18 @@ from sqlalchemy_models_working import (
     Base, CasesBench, Models, Prompts, LlmDiagnosis, LlmDiagnosisRank,
     DiagnosisSemanticRelationship, SeverityLevels, LlmAnalysis
 )
+from db.utils.db_utils import dumps_json # orjson-backed when available; encodes CasesBench.meta_data
+# Leading "1. " style numbering of a predicted diagnosis line, compiled once instead of per row
+RANK_PREFIX_RE = re.compile(r'^\d+\.\s*')
+# Max values bound in one IN (...) list (same bound as queries2.py)
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+def in_chunks(values, size=IN_CLAUSE_CHUNK_SIZE):
+    """Yield successive slices of at most size values, for chunked IN (...) queries."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
 # Note: The original scripts used different ways to get the session (global vs passed).
 # These functions mostly assume a 'session' object is available, either passed or globally.
 # You might need to adapt how the session is provided when calling these functions.
@@ -66,7 +81,7 @@ def process_diagnosis_ranks(session):
                     # Remove any numbering and get just the diagnosis text
                     predicted_diagnosis = diagnoses_list[rank-1]
                     # Remove numbers and periods at the beginning (e.g., "1. ")
-                    predicted_diagnosis = re.sub(r'^\d+\.\s*', '', predicted_diagnosis)
+                    predicted_diagnosis = RANK_PREFIX_RE.sub('', predicted_diagnosis)
                 
                 llm_diagnosis_rank = LlmDiagnosisRank(
                     cases_bench_id=case.id,
@@ -132,7 +147,7 @@ def process_specific_diagnosis(session, diagnosis_id):
                 # Remove any numbering and get just the diagnosis text
                 predicted_diagnosis = diagnoses_list[rank-1]
                 # Remove numbers and periods at the beginning (e.g., "1. ")
-                predicted_diagnosis = re.sub(r'^\d+\.\s*', '', predicted_diagnosis)
+                predicted_diagnosis = RANK_PREFIX_RE.sub('', predicted_diagnosis)
             
             llm_diagnosis_rank = LlmDiagnosisRank(
                 cases_bench_id=case.id,
@@ -288,7 +303,7 @@ def process_cases(session):
                         # Remove any numbering and get just the diagnosis text
                         predicted_diagnosis = diagnoses[rank-1]
                         # Remove numbers and periods at the beginning (e.g., "1. ")
-                        predicted_diagnosis = re.sub(r'^\d+\.\s*', '', predicted_diagnosis)
+                        predicted_diagnosis = RANK_PREFIX_RE.sub('', predicted_diagnosis)
                     
                     llm_diagnosis_rank = LlmDiagnosisRank(
                         cases_bench_id=case.id,
@@ -374,7 +389,7 @@ def process_specific_case(session, case_id):
                     # Remove any numbering and get just the diagnosis text
                     predicted_diagnosis = diagnoses[rank-1]
                     # Remove numbers and periods at the beginning (e.g., "1. ")
-                    predicted_diagnosis = re.sub(r'^\d+\.\s*', '', predicted_diagnosis)
+                    predicted_diagnosis = RANK_PREFIX_RE.sub('', predicted_diagnosis)
                 
                 llm_diagnosis_rank = LlmDiagnosisRank(
                     cases_bench_id=case.id,
@@ -455,7 +470,7 @@ def process_patient_file(session, file_path, model_id, prompt_id):
                         # Remove any numbering and get just the diagnosis text
                         predicted_diagnosis = diagnoses[rank-1]
                         # Remove numbers and periods at the beginning (e.g., "1. ")
-                        predicted_diagnosis = re.sub(r'^\d+\.\s*', '', predicted_diagnosis)
+                        predicted_diagnosis = RANK_PREFIX_RE.sub('', predicted_diagnosis)
                     
                     llm_diagnosis_rank = LlmDiagnosisRank(
                         cases_bench_id=cases_bench.id,
@@ -617,11 +632,29 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
     ranks_added = 0
     
     # Get all JSON files
-    json_files = [f for f in os.listdir(dir_path) if f.endswith('.json') and f.startswith('patient_')]
+    # One directory scan; DirEntry.is_file() reuses the type from the listing instead of a stat per file
+    json_files = [entry.name for entry in os.scandir(dir_path) if entry.name.startswith('patient_') and entry.name.endswith('.json') and entry.is_file()]
     
     # Default rank values from the original script
     DEFAULT_RANK = 6
     RANK_THRESHOLD = 5
+
+    # Local helper to parse rank (from original script), defined once rather than per file
+    def parse_rank(rank_str, default_rank=DEFAULT_RANK, threshold=RANK_THRESHOLD):
+        # Fast path: nearly every predict_rank is a single ASCII digit
+        if isinstance(rank_str, str) and len(rank_str) == 1 and '0' <= rank_str <= '9':
+            rank = ord(rank_str) - 48
+            return default_rank if rank > threshold else rank
+        try:
+            rank = int(rank_str)
+            return default_rank if rank > threshold else rank
+        except (ValueError, TypeError):
+            return default_rank
+
+    # Diagnoses given an analysis earlier in this directory: the rows are only committed
+    # at the end, and the existence query below cannot see them without autoflush
+    # (e.g. with BATCH_SESSION_KWARGS)
+    analysed_diagnosis_ids = set()
     
     for filename in json_files:
         print(filename) # Original script printed filename here
@@ -649,14 +682,6 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
         # Get predict_rank from JSON
         predict_rank_str = data.get("predict_rank", str(DEFAULT_RANK))
         
-        # Local helper to parse rank (from original script)
-        def parse_rank(rank_str, default_rank=DEFAULT_RANK, threshold=RANK_THRESHOLD):
-            try:
-                rank = int(rank_str)
-                return default_rank if rank > threshold else rank
-            except (ValueError, TypeError):
-                return default_rank
-                
         predicted_rank = parse_rank(predict_rank_str)
         print(f"    Parsed rank: {predicted_rank} (from '{predict_rank_str}')") # Added print
 
@@ -672,7 +697,7 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
             continue
         
         # Check if analysis already exists for this diagnosis
-        existing_analysis = session.query(LlmAnalysis).filter_by(
+        existing_analysis = llm_diagnosis.id in analysed_diagnosis_ids or session.query(LlmAnalysis).filter_by(
             llm_diagnosis_id=llm_diagnosis.id
         ).first()
         
@@ -690,12 +715,21 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
             diagnosis_semantic_relationship_id=semantic_id, # Use provided semantic_id
             severity_levels_id=severity_id # Use provided severity_id
         )
+        # Committed with the rest of the directory below
         session.add(llm_analysis)
-        session.commit()
+        analysed_diagnosis_ids.add(llm_diagnosis.id)
         print(f"    Added LlmAnalysis rank for {filename}: {predicted_rank}")
         ranks_added += 1
         
         files_processed += 1
+
+    # One transaction (and one commit) for the whole directory instead of one per file
+    try:
+        session.commit()
+    except Exception as e:
+        print(f"  Error committing LlmAnalysis rows for {dir_name}: {str(e)}")
+        session.rollback()
+        return 0
     
     print(f"  Completed directory {dir_name}. Processed {files_processed} files, added/updated {ranks_added} ranks.")
     return ranks_added
@@ -755,23 +789,24 @@ def process_diagnosis_into_ranks(session, verbose=False):
             continue
         
         # Add each parsed diagnosis as a rank entry
-        added_in_batch = 0
+        rank_rows = []
         for rank_position, diagnosis_text, reasoning in parsed_diagnoses:
             # Ensure diagnosis text fits the likely column size (e.g., VARCHAR(255))
             diagnosis_text_trimmed = diagnosis_text[:254] 
             reasoning_trimmed = reasoning[:254] if reasoning else None # Trim reasoning too
 
-            rank_entry = LlmDiagnosisRank(
-                cases_bench_id=diagnosis.cases_bench_id,
-                llm_diagnosis_id=diagnosis.id,
-                rank_position=rank_position,
-                predicted_diagnosis=diagnosis_text_trimmed,
-                reasoning=reasoning_trimmed
-            )
-            
-            session.add(rank_entry)
-            ranks_added += 1
-            added_in_batch += 1
+            rank_rows.append({
+                "cases_bench_id": diagnosis.cases_bench_id,
+                "llm_diagnosis_id": diagnosis.id,
+                "rank_position": rank_position,
+                "predicted_diagnosis": diagnosis_text_trimmed,
+                "reasoning": reasoning_trimmed
+            })
+        
+        # One executemany (multi-row VALUES) instead of an INSERT per rank
+        session.execute(insert(LlmDiagnosisRank), rank_rows)
+        added_in_batch = len(rank_rows)
+        ranks_added += added_in_batch
         
         # Commit after processing each diagnosis
         session.commit()
@@ -846,22 +881,23 @@ def process_by_model_prompt(session, model_id=None, prompt_id=None, limit=None,
             continue
         
         # Add each parsed diagnosis as a rank entry
-        added_in_batch = 0
+        rank_rows = []
         for rank_position, diagnosis_text, reasoning in parsed_diagnoses:
             diagnosis_text_trimmed = diagnosis_text[:254]
             reasoning_trimmed = reasoning[:254] if reasoning else None
 
-            rank_entry = LlmDiagnosisRank(
-                cases_bench_id=diagnosis.cases_bench_id,
-                llm_diagnosis_id=diagnosis.id,
-                rank_position=rank_position,
-                predicted_diagnosis=diagnosis_text_trimmed,
-                reasoning=reasoning_trimmed
-            )
-            
-            session.add(rank_entry)
-            ranks_added += 1
-            added_in_batch += 1
+            rank_rows.append({
+                "cases_bench_id": diagnosis.cases_bench_id,
+                "llm_diagnosis_id": diagnosis.id,
+                "rank_position": rank_position,
+                "predicted_diagnosis": diagnosis_text_trimmed,
+                "reasoning": reasoning_trimmed
+            })
+        
+        # One executemany (multi-row VALUES) instead of an INSERT per rank
+        session.execute(insert(LlmDiagnosisRank), rank_rows)
+        added_in_batch = len(rank_rows)
+        ranks_added += added_in_batch
         
         # Commit after processing each diagnosis
         session.commit()
@@ -905,30 +941,36 @@ def process_directory_for_diagnoses(session, base_dir, dir_name):
     diagnoses_added = 0
     
     # Get all JSON files
-    json_files = [f for f in os.listdir(dir_path) if f.endswith('.json') and f.startswith('patient_')]
+    # One directory scan; DirEntry.is_file() reuses the type from the listing instead of a stat per file
+    json_files = [entry.name for entry in os.scandir(dir_path) if entry.name.startswith('patient_') and entry.name.endswith('.json') and entry.is_file()]
+
+    # Assuming CasesBench.source_file_path stores just the filename 'patient_N.json'.
+    # Cases for all files in chunked IN queries instead of one per file (rows come highest
+    # id first, so the lowest id wins on duplicates, as with first())
+    path_to_case_id = {}
+    for chunk in in_chunks(json_files):
+        path_to_case_id.update(session.query(CasesBench.source_file_path, CasesBench.id).filter(
+            CasesBench.source_file_path.in_(chunk)
+        ).order_by(CasesBench.id.desc()))
+    # Cases that already have a diagnosis for this model/prompt, in one query
+    diagnosed_case_ids = {case_id for (case_id,) in session.query(LlmDiagnosis.cases_bench_id).filter_by(
+        model_id=model_id,
+        prompt_id=prompt_id
+    )}
     
     for filename in json_files:
         # Find corresponding case in database based on filename
-        # Assuming CasesBench.source_file_path stores just the filename 'patient_N.json'
-        case = session.query(CasesBench).filter(
-            CasesBench.source_file_path == filename 
-        ).first()
+        case_id = path_to_case_id.get(filename)
         
-        if not case:
+        if case_id is None:
             print(f"    Case not found for source_file_path '{filename}', skipping")
             continue
             
-        print (f"Processing {filename} for Case ID: {case.id}")    
+        print (f"Processing {filename} for Case ID: {case_id}")    
 
         # Check if diagnosis already exists for this case/model/prompt
-        existing_diagnosis = session.query(LlmDiagnosis).filter_by(
-            cases_bench_id=case.id,
-            model_id=model_id,
-            prompt_id=prompt_id
-        ).first()
-
-        if existing_diagnosis:
-            print(f"    Diagnosis already exists for {filename} (Case ID: {case.id}, Model ID: {model_id}, Prompt ID: {prompt_id}), skipping.")
+        if case_id in diagnosed_case_ids:
+            print(f"    Diagnosis already exists for {filename} (Case ID: {case_id}, Model ID: {model_id}, Prompt ID: {prompt_id}), skipping.")
             files_processed += 1
             continue
 
@@ -949,19 +991,28 @@ def process_directory_for_diagnoses(session, base_dir, dir_name):
         
         # Add the new diagnosis to the database
         llm_diagnosis = LlmDiagnosis(
-            cases_bench_id=case.id,
+            cases_bench_id=case_id,
             model_id=model_id,
             prompt_id=prompt_id,
             diagnosis=predict_diagnosis, # Store the full text
             timestamp=datetime.datetime.now()
         )
+        # Committed with the rest of the directory below
         session.add(llm_diagnosis)
-        session.commit() # Commit after adding diagnosis
+        diagnosed_case_ids.add(case_id)
         
-        print(f"    Added diagnosis for {filename} (Case ID: {case.id}) -> LlmDiagnosis ID: {llm_diagnosis.id}")
+        print(f"    Added diagnosis for {filename} (Case ID: {case_id})")
         diagnoses_added += 1
         
         files_processed += 1
+
+    # One transaction (and one commit) for the whole directory instead of one per file
+    try:
+        session.commit()
+    except Exception as e:
+        print(f"  Error committing diagnoses for {dir_name}: {str(e)}")
+        session.rollback()
+        return 0
     
     print(f"  Completed directory {dir_name}. Processed {files_processed} files, added {diagnoses_added} new diagnoses.")
     return diagnoses_added
@@ -1012,12 +1063,105 @@ def process_patient_file_for_cases(session, file_path, dir_name): # Removed unus
         return False
 
 
-def process_all_directories_for_cases(session, dirname):
-    """Process all model/prompt directories to ensure CasesBench entries exist."""
+# Number of new CasesBench rows sent per executemany INSERT / commit
+CASES_INSERT_BATCH_SIZE = 5000
+# Directory listings are fetched concurrently only when there are more directories than this
+PARALLEL_LISTING_MIN_DIRS = 4
+MAX_LISTING_WORKERS = 8
+# Threads reading the patient JSON files of one directory
+MAX_LOADING_WORKERS = 16
+
+def list_patient_files(dir_path):
+    """Return the patient_*.json file names in dir_path, or None if it is not a directory."""
+    if not os.path.isdir(dir_path):
+        return None
+    # One directory scan; DirEntry.is_file() reuses the type from the listing instead of a stat per file
+    return [entry.name for entry in os.scandir(dir_path) if entry.name.startswith('patient_') and entry.name.endswith('.json') and entry.is_file()]
+
+def load_patient_json(file_path):
+    """Read one patient JSON file; returns (data, None) or (None, error) so worker threads never raise."""
+    try:
+        with open(file_path, 'r', encoding='utf-8-sig') as f: # Note encoding
+            return json.load(f), None
+    except Exception as e:
+        return None, e
+
+# Column order of the COPY ... FROM STDIN payload built by copy_cases_rows
+CASES_COPY_COLUMNS = ("hospital", "meta_data", "processed_date", "source_type", "source_file_path")
+
+def copy_cases_rows(session, rows, batch_size=CASES_INSERT_BATCH_SIZE):
+    """
+    Insert new CasesBench rows and commit.
+
+    On PostgreSQL with psycopg2 the rows are streamed with a single COPY ... FROM STDIN
+    (CSV), which skips per-row INSERT overhead; other backends/drivers fall back to one
+    executemany INSERT and commit per batch_size rows. On both paths meta_data is
+    encoded with dumps_json (orjson when installed).
+
+    Args:
+        session: SQLAlchemy session
+        rows: List of dicts keyed on CASES_COPY_COLUMNS
+        batch_size: Rows per INSERT on the fallback path
+
+    Returns:
+        Number of rows inserted
+    """
+    if not rows:
+        return 0
+
+    # COPY needs the raw DBAPI cursor; copy_expert is psycopg2-specific
+    cursor = session.connection().connection.cursor() if session.get_bind().dialect.name == "postgresql" else None
+    if cursor is not None and not hasattr(cursor, "copy_expert"):
+        cursor.close()
+        cursor = None
+    if cursor is not None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow((
+                row["hospital"],
+                dumps_json(row["meta_data"]),
+                row["processed_date"].isoformat(),
+                row["source_type"],
+                row["source_file_path"]
+            ))
+        buffer.seek(0)
+        try:
+            cursor.copy_expert(
+                f"COPY {CasesBench.__table__.fullname} ({', '.join(CASES_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+        session.commit()
+        return len(rows)
+
+    # meta_data is bound as already-encoded text: the JSON column would otherwise encode it
+    # with whatever serializer the caller's engine was created with
+    stmt = insert(CasesBench.__table__).values(meta_data=type_coerce(bindparam("meta_data_json"), String))
+    for start in range(0, len(rows), batch_size):
+        session.execute(stmt, [
+            {**{column: row[column] for column in CASES_COPY_COLUMNS if column != "meta_data"},
+             "meta_data_json": dumps_json(row["meta_data"])}
+            for row in rows[start:start + batch_size]
+        ])
+        session.commit()
+    return len(rows)
+
+def process_all_directories_for_cases(session, dirname, batch_size=CASES_INSERT_BATCH_SIZE):
+    """
+    Process all model/prompt directories to ensure CasesBench entries exist.
+
+    Existing source_file_path values are looked up with one query per directory;
+    only the missing patient files are read, and each directory's new rows are
+    written by copy_cases_rows (COPY on PostgreSQL, otherwise one executemany INSERT
+    and commit per batch_size rows), which encodes meta_data with dumps_json.
+    """
     
     # Helper to get directories (similar to other scripts)
     try:
-        directories = [d for d in os.listdir(dirname) if os.path.isdir(os.path.join(dirname, d))]
+        # DirEntry.is_dir() reuses the type from the listing instead of a stat per entry
+        directories = [entry.name for entry in os.scandir(dirname) if entry.is_dir()]
         print(f"Found {len(directories)} potential directories in {dirname}")
     except FileNotFoundError:
         print(f"Error: Base directory '{dirname}' not found.")
@@ -1025,28 +1169,62 @@ def process_all_directories_for_cases(session, dirname):
 
     cases_added = 0
     total_files_processed = 0
+    # source_file_path values known to be in CasesBench; patient files repeat across directories
+    known_paths = set()
+    # One timestamp for the whole run instead of a clock read per new case
+    processed_date = datetime.datetime.now()
+
+    # We don't need model/prompt info for adding cases, just the files. The directory listings
+    # are independent I/O, so they are fetched concurrently; the database work below stays on
+    # the one session, because the same patient files appear in every directory and parallel
+    # writers would insert the same case twice.
+    dir_paths = [os.path.join(dirname, dir_name) for dir_name in directories]
+    if len(dir_paths) > PARALLEL_LISTING_MIN_DIRS:
+        with ThreadPoolExecutor(max_workers=min(MAX_LISTING_WORKERS, len(dir_paths))) as executor:
+            listings = list(executor.map(list_patient_files, dir_paths))
+    else:
+        listings = [list_patient_files(dir_path) for dir_path in dir_paths]
     
     # Process each directory
-    for dir_name in directories:
+    for dir_name, dir_path, filenames in zip(directories, dir_paths, listings):
         print(f"Processing directory for cases: {dir_name}")
         
-        # We don't need model/prompt info for adding cases, just the files
-        dir_path = os.path.join(dirname, dir_name)
-        if not os.path.exists(dir_path) or not os.path.isdir(dir_path):
+        if filenames is None:
             print(f"  Path {dir_path} is not a valid directory, skipping.")
             continue
         
-        files_in_dir = 0
+        # All relevant JSON files in this directory
+        files_in_dir = len(filenames)
         cases_added_in_dir = 0
-        
-        # Process all relevant JSON files in this directory
-        for filename in os.listdir(dir_path):
-            if filename.endswith('.json') and filename.startswith('patient_'):
-                file_path = os.path.join(dir_path, filename)
-                files_in_dir += 1
-                
-                if process_patient_file_for_cases(session, file_path, dir_name): # Pass session
-                    cases_added_in_dir += 1
+
+        # Chunked IN queries for the files of this directory that are not known yet
+        unknown = [f for f in filenames if f not in known_paths]
+        for chunk in in_chunks(unknown):
+            known_paths.update(path for (path,) in session.query(CasesBench.source_file_path).filter(
+                CasesBench.source_file_path.in_(chunk)
+            ))
+
+        # The missing files are read concurrently; rows are then built in listing order
+        missing = [filename for filename in filenames if filename not in known_paths]
+        file_paths = [os.path.join(dir_path, filename) for filename in missing]
+        with ThreadPoolExecutor(max_workers=MAX_LOADING_WORKERS) as executor:
+            loaded = list(executor.map(load_patient_json, file_paths))
+
+        new_rows = []
+        for filename, file_path, (patient_data, error) in zip(missing, file_paths, loaded):
+            if error is not None:
+                print(f"    Error processing file {file_path} for cases: {str(error)}")
+                continue
+            known_paths.add(filename)
+            new_rows.append({
+                "hospital": "ramedis", # Default value from original script
+                "meta_data": patient_data, # Store the full JSON content
+                "processed_date": processed_date,
+                "source_type": "jsonl", # Default value from original script
+                "source_file_path": filename # Use filename as identifier
+            })
+
+        cases_added_in_dir += copy_cases_rows(session, new_rows, batch_size=batch_size)
         
         print(f"  Completed directory {dir_name}. Processed {files_in_dir} files, added {cases_added_in_dir} new case records.")
         total_files_processed += files_in_dir
@@ -3,12 +3,16 @@ import sys
 import datetime
 import re
 import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 # --- Imports from source files ---
 # Adjust path if necessary to find these modules
 # sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../')) 
 
-from db.utils.db_utils import get_session # Assumed common utility
+from db.utils.db_utils import get_session, BATCH_SESSION_KWARGS # Assumed common utility
 from db.bench29.bench29_models import ( # Models used across functions
     CasesBench, LlmDifferentialDiagnosis, DifferentialDiagnosis2Rank, 
     CasesBenchDiagnosis, CasesBenchMetadata, LlmAnalysis
@@ -31,13 +35,98 @@ from hoarder29.scripts.reverse_engineering.dxgpt_prew.utils.utils import extract
 from hoarder29.libs.parser_libs import extract_model_prompt # Used by parse_predicted_ranks/process_directory
 from hoarder29.libs.rank_libs import parse_rank # Used by parse_predicted_ranks/process_directory
 from libs.libs import load_json # Used by parse_cases/process_patient_file
+from libs.json_libs import read_json_file # orjson-backed; used by process_directory_for_diagnoses
+from dxGPT.queries.dxGPT_queries import insert_differential_diagnoses_ignore_existing # Used by process_csv_file
+
+
+# Patient number in a CSV FileName cell, compiled once instead of per row
+PATIENT_NUMBER_RE = re.compile(r'patient_(\d+)')
+
+# IDs resolved by cached_lookup_id, keyed on (lookup function, name)
+_LOOKUP_ID_CACHE = {}
+
+# Max values bound into a single IN (...) list, to stay clear of driver/server parameter limits
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+# Rows fetched per SELECT by iter_by_id
+ID_PAGE_SIZE = 1000
+
+def iter_by_id(query, model, page_size=ID_PAGE_SIZE):
+    """
+    Yield the rows of an ORM query in id order, page_size rows per SELECT.
+
+    Keyset pagination (id > last id seen) keeps only one page in memory, like
+    yield_per, but each page is a separate statement, so callers may commit
+    between rows; a server-side cursor from yield_per/stream_results would be
+    closed by the first commit.
+
+    Args:
+        query: ORM query over model, without ORDER BY/LIMIT
+        model: Mapped class with an integer id primary key
+        page_size: Rows per SELECT
+    """
+    last_id = None
+    while True:
+        page_query = query if last_id is None else query.filter(model.id > last_id)
+        page = page_query.order_by(model.id).limit(page_size).all()
+        yield from page
+        if len(page) < page_size:
+            return
+        last_id = page[-1].id
+
+def insert_ignoring_conflicts(session, model, rows, index_elements):
+    """
+    Insert rows with one executemany, skipping rows that hit the unique key index_elements.
+
+    Uses ON CONFLICT DO NOTHING on PostgreSQL and INSERT OR IGNORE on SQLite, so the
+    database enforces uniqueness in the same round-trip. Does not commit.
+    On PostgreSQL index_elements must match a unique index that exists in the
+    database (see db/migrations/create_indexes.py for existing databases).
+    """
+    if not rows:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        stmt = pg_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    else:
+        stmt = insert(model).prefix_with("OR IGNORE")
+    session.execute(stmt, rows)
+
+def in_chunks(values, size=IN_CLAUSE_CHUNK_SIZE):
+    """Yield successive slices of at most size values, for chunked IN (...) queries."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def cached_lookup_id(session, lookup, name):
+    """
+    Call lookup(session, name) once per name for the process lifetime.
+
+    Model/prompt/registry IDs do not change during a run, so directories and
+    CSV rows that share a model, prompt or severity reuse the first result. Misses (None) are not
+    cached, so a row created later is still found.
+
+    Args:
+        session: SQLAlchemy session
+        lookup: ID lookup function such as get_model_id or get_prompt_id
+        name: Name/alias to look up
+
+    Returns:
+        The ID returned by lookup, or None if not found
+    """
+    key = (lookup, name)
+    value = _LOOKUP_ID_CACHE.get(key)
+    if value is None:
+        value = lookup(session, name)
+        if value is not None:
+            _LOOKUP_ID_CACHE[key] = value
+    return value
 
 
 # === Functions extracted from Kernel29_beridane/src/hoarder29/scripts/reverse_engineering/dxgpt_prew ===
 
 # --- From parse_llm_diagnoses.py ---
 
-def add_llm_diagnosis_to_db(session, case_id, model_id, prompt_id, diagnosis_text, timestamp=None, verbose=False):
+def add_llm_diagnosis_to_db(session, case_id, model_id, prompt_id, diagnosis_text, timestamp=None, commit=True, verbose=False):
     """
     Add a record to the LlmDifferentialDiagnosis table.
     
@@ -48,46 +137,51 @@ def add_llm_diagnosis_to_db(session, case_id, model_id, prompt_id, diagnosis_tex
         prompt_id: Prompt ID
         diagnosis_text: Diagnosis text
         timestamp: Optional timestamp (defaults to current time)
+        commit: Whether to commit; callers batching a whole file pass False and commit once
         verbose: Whether to print debug information
         
     Returns:
         int: ID of the new record or existing record
     """
     
-    # Check if this diagnosis already exists
-    existing = session.query(LlmDifferentialDiagnosis).filter_by(
-        cases_bench_id=case_id,
-        model_id=model_id,
-        prompt_id=prompt_id
-    ).first()
-    
-    if existing:
-        if verbose:
-            print(f"    Diagnosis already exists for case ID {case_id}, skipping")
-        return existing.id
-    
-    # Add new diagnosis
     if timestamp is None:
         timestamp = datetime.datetime.now()
-    
-    new_diagnosis = LlmDifferentialDiagnosis(
-        cases_bench_id=case_id,
-        model_id=model_id,
-        prompt_id=prompt_id,
-        diagnosis=diagnosis_text,
-        timestamp=timestamp
-    )
-    
-    session.add(new_diagnosis)
-    session.commit()
-    session.flush()  # Flush to get the ID
+
+    # One INSERT that skips an existing (case, model, prompt) row via the unique constraint
+    # (ON CONFLICT DO NOTHING on PostgreSQL, INSERT OR IGNORE on SQLite) instead of a
+    # SELECT before every insert; the existing id is only looked up on a conflict
+    row = {
+        "cases_bench_id": case_id,
+        "model_id": model_id,
+        "prompt_id": prompt_id,
+        "diagnosis": diagnosis_text,
+        "timestamp": timestamp
+    }
+    if session.get_bind().dialect.name == "postgresql":
+        stmt = pg_insert(LlmDifferentialDiagnosis).values(row).on_conflict_do_nothing(
+            index_elements=["cases_bench_id", "model_id", "prompt_id"]
+        )
+    else:
+        stmt = insert(LlmDifferentialDiagnosis).values(row).prefix_with("OR IGNORE")
+    new_diagnosis_id = session.execute(stmt.returning(LlmDifferentialDiagnosis.id)).scalar()
+    if commit:
+        session.commit()
+
+    if new_diagnosis_id is None:
+        if verbose:
+            print(f"    Diagnosis already exists for case ID {case_id}, skipping")
+        return session.query(LlmDifferentialDiagnosis.id).filter_by(
+            cases_bench_id=case_id,
+            model_id=model_id,
+            prompt_id=prompt_id
+        ).scalar()
     
     if verbose:
         print(f"    Added diagnosis for case ID {case_id}")
     
-    return new_diagnosis.id
+    return new_diagnosis_id
 
-def add_diagnosis_rank_to_db(session, case_id, differential_diagnosis_id, rank, diagnosis_name, reasoning, verbose=False):
+def add_diagnosis_rank_to_db(session, case_id, differential_diagnosis_id, rank, diagnosis_name, reasoning, commit=True, verbose=False):
     """
     Add a record to the DifferentialDiagnosis2Rank table.
     
@@ -98,6 +192,7 @@ def add_diagnosis_rank_to_db(session, case_id, differential_diagnosis_id, rank,
         rank: Rank position
         diagnosis_name: Diagnosis name
         reasoning: Reasoning text
+        commit: Whether to commit; with False the row is only added to the session
         verbose: Whether to print debug information
         
     Returns:
@@ -128,7 +223,8 @@ def add_diagnosis_rank_to_db(session, case_id, differential_diagnosis_id, rank,
     )
     
     session.add(new_rank)
-    session.commit()
+    if commit:
+        session.commit()
     if verbose:
         print(f"    Added rank {rank} for diagnosis ID {differential_diagnosis_id}")
     
@@ -148,7 +244,7 @@ def get_cases(session):
     print(f"Found {len(all_cases)} cases")
     return all_cases
 
-def add_golden_diagnosis_to_db(session, case_id, gold_diagnosis, alternative_diagnosis=None, further=None, verbose=False):
+def add_golden_diagnosis_to_db(session, case_id, gold_diagnosis, alternative_diagnosis=None, further=None, commit=True, verbose=False):
     """
     Add a record to the CasesBenchDiagnosis table.
     
@@ -158,6 +254,7 @@ def add_golden_diagnosis_to_db(session, case_id, gold_diagnosis, alternative_dia
         gold_diagnosis: Primary gold diagnosis
         alternative_diagnosis: Optional alternative diagnosis
         further: Optional further diagnosis information
+        commit: Whether to commit; with False the row is only flushed (to get its ID)
         verbose: Whether to print debug information
         
     Returns:
@@ -186,8 +283,10 @@ def add_golden_diagnosis_to_db(session, case_id, gold_diagnosis, alternative_dia
     
     try:
         session.add(new_diagnosis)
-        session.commit()
-        session.flush()  # Flush to get the ID
+        if commit:
+            session.commit()
+        else:
+            session.flush()  # Flush to get the ID
         
         if verbose:
             print(f"    Added golden diagnosis for case ID {case_id}")
@@ -229,6 +328,7 @@ def add_case_metadata(
     comments=None,
     severity_levels_id=None,
     complexity_level_id=None,
+    commit=True,
     verbose=False
 ):
     """
@@ -245,6 +345,7 @@ def add_case_metadata(
         comments: Additional comments
         severity_levels_id: ID of severity level
         complexity_level_id: ID of complexity level
+        commit: Whether to commit; with False the row is only flushed (to get its ID)
         verbose: Whether to print debug information
         
     Returns:
@@ -278,8 +379,10 @@ def add_case_metadata(
     
     try:
         session.add(new_metadata)
-        session.commit()
-        session.flush()  # Flush to get the ID
+        if commit:
+            session.commit()
+        else:
+            session.flush()  # Flush to get the ID
         
         if verbose:
             print(f"    Added metadata for case ID {cases_bench_id}")
@@ -290,6 +393,13 @@ def add_case_metadata(
         print(f"Error adding case metadata to database: {e}")
         return None
 
+# Columns process_csv_file reads; any other CSV column is not parsed at all
+CSV_COLUMNS = frozenset({
+    "FileName", "Ground_Truth_Diagnosis", "Alternative Diagnosis", "Further Considerations",
+    "Severity", "Disease_Type", "Primary_Medical_Specialty", "Sub_Medical_Specialty",
+    "Alternative_Medical_Specialty", "Comments", "LLM_Differential_Diagnosis_Output"
+})
+
 def process_csv_file(session, csv_file, verbose=False):
     """
     Process a single CSV file containing case information and LLM diagnoses.
@@ -302,7 +412,9 @@ def process_csv_file(session, csv_file, verbose=False):
     import pandas as pd # Local import for function scope
 
     try:
-        df = pd.read_csv(csv_file)
+        # Only the used columns, all read as text (no per-column type inference); a callable
+        # usecols tolerates the optional columns being absent, which row.get() relies on
+        df = pd.read_csv(csv_file, usecols=lambda column: column in CSV_COLUMNS, dtype=str)
     except FileNotFoundError:
         print(f"Error: CSV file not found at {csv_file}")
         return
@@ -317,7 +429,25 @@ def process_csv_file(session, csv_file, verbose=False):
     cases = get_cases(session)
     patient_to_case = map_cases(cases) # Helper function defined elsewhere
 
-    for index, row in df.iterrows():
+    # Golden diagnoses, metadata, LLM diagnoses and ranks are collected and inserted after
+    # the loop, and the whole file is committed once. New LLM diagnoses go in one multi-row
+    # INSERT ... RETURNING, so their IDs come back in a single round-trip instead of one per
+    # row; ranks of new diagnoses wait for those IDs. Ranks are only ever written together
+    # with the diagnosis they belong to, by whoever inserted it, so parallel workers
+    # (process_all_csv_files) never write ranks for the same diagnosis twice.
+    golden_rows = []
+    metadata_rows = []
+    rank_rows = []
+    # (case, model, prompt) -> row for LLM diagnoses not in the database yet
+    new_diagnoses = {}
+    # (case, model, prompt, rank, name, reasoning) for ranks of those new diagnoses
+    new_diagnosis_ranks = []
+    timestamp = datetime.datetime.now()
+    # Model, prompt and case are resolved for every row first, so that only the
+    # cases of this file are prefetched below
+    resolved_rows = []
+    # Plain dicts per row (same .get()/[] access as a Series) instead of building a Series per row with iterrows()
+    for row in df.to_dict('records'):
         # --- Extract model and prompt ---
         model_name = extract_model_from_filename(row["FileName"], verbose=verbose, deep_verbose=verbose) # Util function
         if not model_name:
@@ -325,11 +455,12 @@ def process_csv_file(session, csv_file, verbose=False):
             
         prompt_name = "dxgpt_prompt" # Hardcoded in original script
         
-        model_id = add_model(session, model_name) # Imported query function
-        prompt_id = add_prompt(session, prompt_name) # Imported query function
+        # Get-or-create once per name for the run instead of two queries per CSV row
+        model_id = cached_lookup_id(session, add_model, model_name) # Imported query function
+        prompt_id = cached_lookup_id(session, add_prompt, prompt_name) # Imported query function
         
         # --- Extract patient number ---
-        patient_num_match = re.search(r'patient_(\d+)', row["FileName"])
+        patient_num_match = PATIENT_NUMBER_RE.search(row["FileName"])
         if not patient_num_match:
             if verbose:
                 print(f"    Could not extract patient number from {row['FileName']}")
@@ -344,34 +475,67 @@ def process_csv_file(session, csv_file, verbose=False):
                 print(f"    Case for patient {patient_num} not found in database, skipping")
             continue
             
-        case_id = case.id
-        
-        # --- Add Golden Diagnosis ---
+        resolved_rows.append((row, model_id, prompt_id, case.id))
+
+    # Existing rows of this file's cases are loaded in chunked IN queries, instead of an
+    # existence SELECT per CSV row (or whole tables); keys of queued rows are added too,
+    # since a case appears once per model in the CSV
+    file_case_ids = {case_id for _, _, _, case_id in resolved_rows}
+    golden_case_ids = set()
+    metadata_case_ids = set()
+    diagnosis_ids = {}
+    for chunk in in_chunks(file_case_ids):
+        golden_case_ids.update(case_id for (case_id,) in session.query(CasesBenchDiagnosis.cases_bench_id).filter(
+            CasesBenchDiagnosis.cases_bench_id.in_(chunk)
+        ))
+        metadata_case_ids.update(case_id for (case_id,) in session.query(CasesBenchMetadata.cases_bench_id).filter(
+            CasesBenchMetadata.cases_bench_id.in_(chunk)
+        ))
+        diagnosis_ids.update(
+            ((case_id, model_id, prompt_id), diagnosis_id)
+            for diagnosis_id, case_id, model_id, prompt_id in session.query(
+                LlmDifferentialDiagnosis.id,
+                LlmDifferentialDiagnosis.cases_bench_id,
+                LlmDifferentialDiagnosis.model_id,
+                LlmDifferentialDiagnosis.prompt_id
+            ).filter(LlmDifferentialDiagnosis.cases_bench_id.in_(chunk))
+        )
+
+    for row, model_id, prompt_id, case_id in resolved_rows:
+        # --- Queue Golden Diagnosis ---
         gold_diagnosis = row.get("Ground_Truth_Diagnosis")
         alternative_diagnosis = row.get("Alternative Diagnosis")
         further_diagnosis = row.get("Further Considerations")
         
         if gold_diagnosis:
-            add_golden_diagnosis_to_db( # Function defined above
-                session, case_id, gold_diagnosis, 
-                alternative_diagnosis, further_diagnosis, verbose=verbose
-            )
+            if case_id not in golden_case_ids:
+                golden_case_ids.add(case_id)
+                golden_rows.append({
+                    "cases_bench_id": case_id,
+                    "gold_diagnosis": gold_diagnosis,
+                    "alternative": alternative_diagnosis,
+                    "further": further_diagnosis
+                })
+            elif verbose:
+                print(f"    Golden diagnosis already exists for case ID {case_id}, skipping")
             
-        # --- Add Case Metadata ---
-        severity_name = row.get("Severity")
-        severity_id = get_severity_id_by_name(session, severity_name) if severity_name else None # Function defined above
-        
-        add_case_metadata( # Function defined above
-            session, case_id,
-            disease_type=row.get("Disease_Type"),
-            primary_medical_specialty=row.get("Primary_Medical_Specialty"),
-            sub_medical_specialty=row.get("Sub_Medical_Specialty"),
-            alternative_medical_specialty=row.get("Alternative_Medical_Specialty"),
-            comments=row.get("Comments"),
-            severity_levels_id=severity_id,
-            # complexity_level_id=None # Not present in sample CSV processing?
-            verbose=verbose
-        )
+        # --- Queue Case Metadata ---
+        if case_id not in metadata_case_ids:
+            metadata_case_ids.add(case_id)
+            severity_name = row.get("Severity")
+            severity_id = cached_lookup_id(session, get_severity_id_by_name, severity_name) if severity_name else None # Function defined above
+            metadata_rows.append({
+                "cases_bench_id": case_id,
+                "disease_type": row.get("Disease_Type"),
+                "primary_medical_specialty": row.get("Primary_Medical_Specialty"),
+                "sub_medical_specialty": row.get("Sub_Medical_Specialty"),
+                "alternative_medical_specialty": row.get("Alternative_Medical_Specialty"),
+                "comments": row.get("Comments"),
+                "severity_levels_id": severity_id
+                # complexity_level_id=None # Not present in sample CSV processing?
+            })
+        elif verbose:
+            print(f"    Metadata already exists for case ID {case_id}, skipping")
 
         # --- Add LLM Differential Diagnosis ---
         llm_output = row.get("LLM_Differential_Diagnosis_Output")
@@ -380,13 +544,21 @@ def process_csv_file(session, csv_file, verbose=False):
                 print(f"    No LLM output found for {row['FileName']}")
             continue
             
-        differential_diagnosis_id = add_llm_diagnosis_to_db( # Function defined above
-            session, case_id, model_id, prompt_id, llm_output, 
-            timestamp=None, # Use default timestamp
-            verbose=verbose
-        )
+        diagnosis_key = (case_id, model_id, prompt_id)
+        if diagnosis_key in diagnosis_ids or diagnosis_key in new_diagnoses:
+            # Its ranks were written (or are queued) with the diagnosis itself
+            if verbose:
+                print(f"    Diagnosis already exists for case ID {case_id}, skipping")
+            continue
+        new_diagnoses[diagnosis_key] = {
+            "cases_bench_id": case_id,
+            "model_id": model_id,
+            "prompt_id": prompt_id,
+            "diagnosis": llm_output,
+            "timestamp": timestamp
+        }
 
-        # --- Parse LLM Output and Add Ranks ---
+        # --- Parse LLM Output and Queue Ranks ---
         parsed_diagnoses = universal_dif_diagnosis_parser(llm_output, verbose=verbose) # Parser function
         
         if not parsed_diagnoses:
@@ -394,18 +566,92 @@ def process_csv_file(session, csv_file, verbose=False):
                 print(f"    Could not parse diagnoses from LLM output for {row['FileName']}")
             continue
             
+        # Repeated rank positions in one output keep the first, as before
+        queued_ranks = set()
         for rank, diagnosis_name, reasoning in parsed_diagnoses:
-            add_diagnosis_rank_to_db( # Function defined above
-                session, case_id, differential_diagnosis_id, 
-                rank, diagnosis_name, reasoning, verbose=verbose
-            )
+            if rank not in queued_ranks:
+                queued_ranks.add(rank)
+                new_diagnosis_ranks.append((diagnosis_key, rank, diagnosis_name, reasoning))
+
+    # One executemany INSERT per table and a single commit for the whole file; golden
+    # diagnoses and metadata are unique per case, so a row written concurrently since
+    # the prefetch is skipped by the database instead of failing the file
+    try:
+        insert_ignoring_conflicts(session, CasesBenchDiagnosis, golden_rows, ["cases_bench_id"])
+        insert_ignoring_conflicts(session, CasesBenchMetadata, metadata_rows, ["cases_bench_id"])
+        if new_diagnoses:
+            new_ids = insert_differential_diagnoses_ignore_existing(session, list(new_diagnoses.values()))
+            # Rows skipped as conflicts were inserted concurrently by another worker,
+            # which also writes their ranks; only the diagnoses inserted here get ranks
+            rank_rows.extend({
+                "cases_bench_id": diagnosis_key[0],
+                "differential_diagnosis_id": new_ids[diagnosis_key],
+                "rank_position": rank,
+                "predicted_diagnosis": diagnosis_name,
+                "reasoning": reasoning
+            } for diagnosis_key, rank, diagnosis_name, reasoning in new_diagnosis_ranks if diagnosis_key in new_ids)
+        if rank_rows:
+            session.execute(insert(DifferentialDiagnosis2Rank), rank_rows)
+        session.commit()
+    except Exception as e:
+        print(f"Error adding rows from {csv_file}: {e}")
+        session.rollback()
+        return
 
+    if verbose:
+        print(f"Added {len(golden_rows)} golden diagnoses, {len(metadata_rows)} metadata rows, "
+              f"{len(new_diagnoses)} LLM diagnoses and {len(rank_rows)} ranks")
     if verbose:
         print(f"Finished processing {csv_file}")
 
+def _process_csv_file_in_worker(csv_file, verbose=False):
+    """Worker-process entry point: process one CSV with a session of its own."""
+    # process_csv_file only queries, inserts through Core statements and commits; it never
+    # reads back a pending ORM object, so the batch session options are safe here
+    # One session per file on an engine of its own: the engine is disposed with it, so a
+    # worker process reused for the next file does not keep an idle connection per file
+    engine, session = get_session(verbose=False, get_engine=True, session_kwargs=BATCH_SESSION_KWARGS)
+    try:
+        process_csv_file(session, csv_file, verbose=verbose)
+    finally:
+        session.close()
+        engine.dispose()
+    return csv_file
+
+def process_all_csv_files(csv_files, max_workers=None, verbose=False):
+    """
+    Process several CSV files concurrently, one worker process and session per file.
+
+    CSV files are independent inputs and process_csv_file is mostly Python work
+    (parsing, row building), so separate processes sidestep the GIL. Golden
+    diagnoses, metadata and LLM diagnoses are inserted with ON CONFLICT DO NOTHING,
+    so workers racing on the same case do not fail; ranks are written only by the
+    worker whose INSERT created their diagnosis, so they are never duplicated.
+
+    Args:
+        csv_files: Paths of the CSV files to process
+        max_workers: Worker processes (defaults to the CPU count, capped at the file count)
+        verbose: Whether to print debug information
+    """
+    from concurrent.futures import ProcessPoolExecutor # Local import for function scope
+
+    csv_files = list(csv_files)
+    if not csv_files:
+        return
+    max_workers = min(max_workers or os.cpu_count() or 1, len(csv_files))
+    if max_workers == 1:
+        for csv_file in csv_files:
+            _process_csv_file_in_worker(csv_file, verbose=verbose)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for csv_file in executor.map(_process_csv_file_in_worker, csv_files, [verbose] * len(csv_files)):
+            if verbose:
+                print(f"Done: {csv_file}")
+
 # --- From parse_cases.py ---
 
-def process_patient_file(session, file_path, model_id, prompt_id, dir_name, verbose=False):
+def process_patient_file(session, file_path, model_id, prompt_id, dir_name, processed_date=None, verbose=False):
     """
     Process a single patient JSON file and add to CasesBench database if needed.
     (Version from parse_cases.py in dxgpt_prew)
@@ -416,6 +662,8 @@ def process_patient_file(session, file_path, model_id, prompt_id, dir_name, verb
         model_id: ID of the model used (unused in this version's core logic)
         prompt_id: ID of the prompt used (unused in this version's core logic)
         dir_name: Directory name for context (unused in this version's core logic)
+        processed_date: Optional processed_date for a new case (defaults to current time);
+            callers looping over a directory pass one value for all its files
         verbose: Whether to print detailed information
         
     Returns:
@@ -445,7 +693,7 @@ def process_patient_file(session, file_path, model_id, prompt_id, dir_name, verb
         cases_bench = CasesBench(
             hospital="ramedis", # Default from original
             meta_data=patient_data,
-            processed_date=datetime.datetime.now(),
+            processed_date=processed_date if processed_date is not None else datetime.datetime.now(),
             source_type="jsonl", # Default from original
             source_file_path=source_file_path
         )
@@ -484,8 +732,8 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
         return 0
     
     # Get model and prompt IDs
-    model_id = get_model_id(session, model_name) # Imported query function
-    prompt_id = get_prompt_id(session, prompt_name) # Imported query function
+    model_id = cached_lookup_id(session, get_model_id, model_name) # Imported query function
+    prompt_id = cached_lookup_id(session, get_prompt_id, prompt_name) # Imported query function
     
     if not model_id or not prompt_id:
         if verbose:
@@ -507,21 +755,44 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
     ranks_added = 0
     
     # Get all JSON files
-    json_files = [f for f in os.listdir(dir_path) if f.endswith('.json') and f.startswith('patient_')]
+    # One directory scan; DirEntry.is_file() reuses the type from the listing instead of a stat per file
+    json_files = [entry.name for entry in os.scandir(dir_path) if entry.name.startswith('patient_') and entry.name.endswith('.json') and entry.is_file()]
     
     # Define default rank here as it was in __main__ before
     DEFAULT_RANK = 6 
+    analyses_batch = []
+
+    # Cases and this model/prompt's diagnoses for all files, with one IN query per
+    # IN_CLAUSE_CHUNK_SIZE files instead of two queries per file; rows come highest
+    # id first so that, as with first(), the lowest id wins on duplicates
+    case_map = {}
+    for chunk in in_chunks(json_files):
+        case_map.update(session.query(CasesBench.source_file_path, CasesBench.id).filter(
+            CasesBench.source_file_path.in_(chunk)
+        ).order_by(CasesBench.id.desc()))
+    diagnosis_map = {}
+    for chunk in in_chunks(set(case_map.values())):
+        diagnosis_map.update(session.query(LlmDifferentialDiagnosis.cases_bench_id, LlmDifferentialDiagnosis.id).filter(
+            LlmDifferentialDiagnosis.cases_bench_id.in_(chunk),
+            LlmDifferentialDiagnosis.model_id == model_id,
+            LlmDifferentialDiagnosis.prompt_id == prompt_id
+        ).order_by(LlmDifferentialDiagnosis.id.desc()))
+    # Diagnoses of this model/prompt that already have an analysis, in one query instead of one per file
+    analysed_diagnosis_ids = {diagnosis_id for (diagnosis_id,) in session.query(LlmAnalysis.llm_diagnosis_id).join(
+        LlmDifferentialDiagnosis, LlmAnalysis.llm_diagnosis_id == LlmDifferentialDiagnosis.id
+    ).filter(
+        LlmDifferentialDiagnosis.model_id == model_id,
+        LlmDifferentialDiagnosis.prompt_id == prompt_id
+    )}
 
     for filename in json_files:
         if verbose:
             print(f"Processing {filename}")
         
         # Find corresponding case in database based on filename
-        case = session.query(CasesBench).filter(
-            CasesBench.source_file_path == filename
-        ).first()
+        case_id = case_map.get(filename)
         
-        if not case:
+        if case_id is None:
             if verbose:
                 print(f"    Case not found for {filename}, skipping")
             continue
@@ -541,45 +812,45 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
         
         # Find the corresponding LlmDiagnosis record
         # NOTE: Original used LlmDiagnosis, this dir uses LlmDifferentialDiagnosis
-        llm_diagnosis = session.query(LlmDifferentialDiagnosis).filter_by(
-            cases_bench_id=case.id,
-            model_id=model_id,
-            prompt_id=prompt_id
-        ).first()
+        llm_diagnosis_id = diagnosis_map.get(case_id)
         
-        if not llm_diagnosis:
+        if llm_diagnosis_id is None:
             if verbose:
                 print(f"    No LlmDifferentialDiagnosis found for {filename}, model_id {model_id}, prompt_id {prompt_id}, skipping")
             continue
         
-        # Check if analysis already exists for this diagnosis
-        existing_analysis = session.query(LlmAnalysis).filter_by(
-            llm_diagnosis_id=llm_diagnosis.id # Uses LlmDifferentialDiagnosis ID
-        ).first()
-        
-        if existing_analysis:
+        # Check if analysis already exists for this diagnosis (uses LlmDifferentialDiagnosis ID)
+        if llm_diagnosis_id in analysed_diagnosis_ids:
             # Skip if analysis already exists
             if verbose:
-                print(f"    Analysis already exists for {filename} (Diagnosis ID: {llm_diagnosis.id}), skipping")
+                print(f"    Analysis already exists for {filename} (Diagnosis ID: {llm_diagnosis_id}), skipping")
             files_processed += 1
             continue
             
-        # Create a new LlmAnalysis record
-        llm_analysis = LlmAnalysis(
-            cases_bench_id=case.id,
-            llm_diagnosis_id=llm_diagnosis.id, # Link to LlmDifferentialDiagnosis
-            predicted_rank=predicted_rank,
-            diagnosis_semantic_relationship_id=semantic_id, # From function args
-            severity_levels_id=severity_id # From function args
-        )
-        session.add(llm_analysis)
-        session.commit()
+        # Queue a new LlmAnalysis row; the directory is inserted with one executemany below
+        analyses_batch.append({
+            "cases_bench_id": case_id,
+            "llm_diagnosis_id": llm_diagnosis_id, # Link to LlmDifferentialDiagnosis
+            "predicted_rank": predicted_rank,
+            "diagnosis_semantic_relationship_id": semantic_id, # From function args
+            "severity_levels_id": severity_id # From function args
+        })
+        analysed_diagnosis_ids.add(llm_diagnosis_id)
         
         if verbose:
-            print(f"    Added LlmAnalysis rank for {filename}: {predicted_rank}")
-        ranks_added += 1
+            print(f"    Queued LlmAnalysis rank for {filename}: {predicted_rank}")
         
         files_processed += 1
+
+    # One INSERT (executemany) and commit per directory instead of one per file
+    if analyses_batch:
+        try:
+            session.execute(insert(LlmAnalysis), analyses_batch)
+            session.commit()
+            ranks_added = len(analyses_batch)
+        except Exception as e:
+            print(f"  Error adding {len(analyses_batch)} LlmAnalysis rows for {dir_name}: {e}")
+            session.rollback()
     
     if verbose:
         print(f"  Completed directory {dir_name}. Processed {files_processed} files, added/updated {ranks_added} ranks.")
@@ -587,7 +858,24 @@ def process_directory_for_ranks(session, base_dir, dir_name, semantic_id, severi
 
 # --- From parse_llm_ranks.py ---
 
-def process_diagnosis_into_ranks(session, verbose=False, deep_verbose=False):
+def _insert_rank_batch(session, batch, verbose=False):
+    """Insert the pending DifferentialDiagnosis2Rank rows with one executemany and commit; empties the batch."""
+    if not batch:
+        return 0
+    count = len(batch)
+    try:
+        session.execute(insert(DifferentialDiagnosis2Rank), batch)
+        session.commit()
+    except Exception as e:
+        print(f"Error adding a batch of {count} ranks: {e}")
+        session.rollback()
+        count = 0
+    if verbose:
+        print(f"  Committed {count} ranks")
+    batch.clear()
+    return count
+
+def process_diagnosis_into_ranks(session, verbose=False, deep_verbose=False, batch_size=5000):
     """
     Process all diagnosis strings in LlmDifferentialDiagnosis table and parse each line
     into a separate rank in the DifferentialDiagnosis2Rank table.
@@ -597,38 +885,33 @@ def process_diagnosis_into_ranks(session, verbose=False, deep_verbose=False):
         session: Database session
         verbose: Whether to print basic workflow information
         deep_verbose: Whether to print detailed parsing information
+        batch_size: Number of rank rows per executemany INSERT / commit
     """
-    # Get all LLM diagnoses (using the correct table name)
-    diagnoses = session.query(LlmDifferentialDiagnosis).all()
+    # Only the diagnoses that still need ranks: non-empty text and no DifferentialDiagnosis2Rank
+    # row yet (anti-join), so the database does the filtering instead of a check per row
+    query = session.query(LlmDifferentialDiagnosis).outerjoin(
+        DifferentialDiagnosis2Rank,
+        DifferentialDiagnosis2Rank.differential_diagnosis_id == LlmDifferentialDiagnosis.id
+    ).filter(
+        DifferentialDiagnosis2Rank.id.is_(None),
+        LlmDifferentialDiagnosis.diagnosis.isnot(None),
+        LlmDifferentialDiagnosis.diagnosis != ''
+    )
     if verbose:
-        print(f"Found {len(diagnoses)} LlmDifferentialDiagnosis records to process")
+        print(f"Found {query.count()} unranked LlmDifferentialDiagnosis records to process")
+    # Streamed in id pages instead of materializing the whole table with .all()
+    diagnoses = iter_by_id(query, LlmDifferentialDiagnosis)
     
     diagnoses_processed = 0
     ranks_added = 0
     parse_failures = 0
+    # Pending DifferentialDiagnosis2Rank rows, inserted and committed every batch_size rows
+    batch = []
     
     for diagnosis in diagnoses:
         if verbose:
             print(f"Processing LlmDifferentialDiagnosis ID: {diagnosis.id}")
         
-        # Check if diagnosis has text
-        if not diagnosis.diagnosis:
-            if verbose:
-                print(f"  Diagnosis ID {diagnosis.id} has empty text, skipping")
-            diagnoses_processed += 1
-            continue
-        
-        # Check if any ranks already exist for this diagnosis
-        existing_ranks = session.query(DifferentialDiagnosis2Rank).filter(
-            DifferentialDiagnosis2Rank.differential_diagnosis_id == diagnosis.id
-        ).count()
-        
-        if existing_ranks > 0:
-            if verbose:
-                print(f"  Diagnosis ID {diagnosis.id} already has {existing_ranks} ranks, skipping")
-            diagnoses_processed += 1
-            continue
-        
         # Parse the diagnosis text (using imported helper)
         # Note: Original parse_diagnosis_text returned multiple items, 
         # this script's version seems to expect rank, name, reasoning. Adjust if needed.
@@ -651,7 +934,6 @@ def process_diagnosis_into_ranks(session, verbose=False, deep_verbose=False):
              diagnoses_processed += 1
              continue
 
-        added_in_batch = 0
         for rank_position, diagnosis_text_parsed, reasoning in parsed_results:
             if rank_position is None or diagnosis_text_parsed is None:
                 parse_failures += 1
@@ -659,31 +941,23 @@ def process_diagnosis_into_ranks(session, verbose=False, deep_verbose=False):
                      print(f"  Parsing failed for one rank in diagnosis ID {diagnosis.id}")
                 continue # Skip this specific parsed item if invalid
 
-            # Add the diagnosis rank entry using imported query function
-            try:
-                add_diagnosis_rank( # Imported query function
-                    session, 
-                    diagnosis.cases_bench_id,
-                    diagnosis.id,
-                    rank_position,
-                    diagnosis_text_parsed, # Use parsed text
-                    reasoning,
-                    verbose=deep_verbose
-                )
-                ranks_added += 1
-                added_in_batch += 1
-                if verbose and not deep_verbose: # Avoid double printing if deep_verbose is on
-                    print(f"  Added rank entry: rank={rank_position}, diagnosis='{str(diagnosis_text_parsed)[:30]}...'")
-            except Exception as e:
-                 print(f"Error adding rank for diagnosis ID {diagnosis.id}, rank {rank_position}: {e}")
-                 session.rollback() # Rollback failed add
+            # Queue the diagnosis rank entry (same columns and 254-char truncation as add_diagnosis_rank)
+            batch.append({
+                "cases_bench_id": diagnosis.cases_bench_id,
+                "differential_diagnosis_id": diagnosis.id,
+                "rank_position": rank_position,
+                "predicted_diagnosis": diagnosis_text_parsed[:254], # Use parsed text
+                "reasoning": reasoning
+            })
+            if verbose and not deep_verbose: # Avoid double printing if deep_verbose is on
+                print(f"  Queued rank entry: rank={rank_position}, diagnosis='{str(diagnosis_text_parsed)[:30]}...'")
 
-        if added_in_batch > 0:
-             session.commit() # Commit batch for this diagnosis
-             if verbose:
-                 print(f"  Committed {added_in_batch} ranks for diagnosis ID {diagnosis.id}")
+        if len(batch) >= batch_size:
+            ranks_added += _insert_rank_batch(session, batch, verbose=verbose)
 
         diagnoses_processed += 1
+
+    ranks_added += _insert_rank_batch(session, batch, verbose=verbose)
     
     if verbose:
         print(f"Rank processing completed. Processed {diagnoses_processed} diagnoses, added {ranks_added} ranks.")
@@ -714,17 +988,20 @@ def process_by_model_prompt(session, model_id=None, prompt_id=None, limit=None,
     if prompt_id is not None:
         query = query.filter(LlmDifferentialDiagnosis.prompt_id == prompt_id)
         filter_info.append(f"prompt_id={prompt_id}")
+    # Streamed in id pages instead of materializing every row with .all();
+    # the limit applies to the stream (lowest ids first)
+    diagnoses = iter_by_id(query, LlmDifferentialDiagnosis)
     if limit is not None:
-        query = query.limit(limit)
+        diagnoses = islice(diagnoses, limit)
         filter_info.append(f"limit={limit}")
     
-    # Execute query
-    diagnoses = query.all()
-    
     # Print filter information
     if verbose:
         filter_str = ", ".join(filter_info) if filter_info else "no filters"
-        print(f"Found {len(diagnoses)} LlmDifferentialDiagnosis records to process ({filter_str})")
+        total = query.count()
+        if limit is not None:
+            total = min(total, limit)
+        print(f"Found {total} LlmDifferentialDiagnosis records to process ({filter_str})")
     
     # Process each diagnosis
     diagnoses_processed = 0
@@ -812,12 +1089,24 @@ def process_by_model_prompt(session, model_id=None, prompt_id=None, limit=None,
 
 # --- From parse_llm_diagnoses_working.py ---
 
-def process_directory_for_diagnoses(session, base_dir, dir_name):
+# Threads reading the patient JSON files of one directory
+MAX_LOADING_WORKERS = 8
+
+def read_patient_json(file_path):
+    """Read one patient JSON file; returns (data, None) or (None, error) so worker threads never raise."""
+    try:
+        return read_json_file(file_path, encoding='utf-8-sig'), None # Note encoding
+    except Exception as e:
+        return None, e
+
+def process_directory_for_diagnoses(session, base_dir, dir_name, verbose=False):
     """
     Process a single model-prompt directory to add LlmDiagnosis records.
     (Version from parse_llm_diagnoses_working.py in dxgpt_prew)
     NOTE: This version uses LlmDiagnosis, while others use LlmDifferentialDiagnosis.
           Ensure the correct models/imports are used if combining/calling these.
+    Per-file messages are printed only when verbose is set, as in the other
+    process_directory_* functions; errors and the directory summary always are.
     """
     # Local import specific to this original script's context
     from sqlalchemy_models_working import LlmDiagnosis 
@@ -830,8 +1119,8 @@ def process_directory_for_diagnoses(session, base_dir, dir_name):
     
     # Get or create model and prompt IDs
     # Assuming get_model_id/get_prompt_id work with the Models/Prompts tables imported above
-    model_id = get_model_id(session, model_name) 
-    prompt_id = get_prompt_id(session, prompt_name)
+    model_id = cached_lookup_id(session, get_model_id, model_name)
+    prompt_id = cached_lookup_id(session, get_prompt_id, prompt_name)
     
     # Check if model/prompt exist before proceeding
     if not model_id or not prompt_id:
@@ -851,62 +1140,88 @@ def process_directory_for_diagnoses(session, base_dir, dir_name):
     diagnoses_added = 0
     
     # Get all JSON files
-    json_files = [f for f in os.listdir(dir_path) if f.endswith('.json') and f.startswith('patient_')]
+    # One directory scan; DirEntry.is_file() reuses the type from the listing instead of a stat per file
+    json_files = [entry.name for entry in os.scandir(dir_path) if entry.name.startswith('patient_') and entry.name.endswith('.json') and entry.is_file()]
+
+    # Cases that already have a diagnosis for this model/prompt, loaded in one query
+    existing_case_ids = {case_id for (case_id,) in session.query(LlmDiagnosis.cases_bench_id).filter_by(
+        model_id=model_id,
+        prompt_id=prompt_id
+    )}
+    # Cases for all files in chunked IN queries instead of one per file (lowest id wins, as with first())
+    case_map = {}
+    for chunk in in_chunks(json_files):
+        case_map.update(session.query(CasesBench.source_file_path, CasesBench.id).filter(
+            CasesBench.source_file_path.in_(chunk)
+        ).order_by(CasesBench.id.desc()))
+    # New diagnoses are collected and inserted together after the loop, all with one timestamp
+    new_rows = []
+    timestamp = datetime.datetime.now()
     
+    # Files whose case exists and has no diagnosis yet; only these are read
+    to_read = []
     for filename in json_files:
         # Find corresponding case in database based on filename
-        case = session.query(CasesBench).filter(
-            CasesBench.source_file_path == filename 
-        ).first()
+        case_id = case_map.get(filename)
         
-        if not case:
-            print(f"    Case not found for source_file_path '{filename}', skipping")
+        if case_id is None:
+            if verbose:
+                print(f"    Case not found for source_file_path '{filename}', skipping")
             continue
             
-        print (f"Processing {filename} for Case ID: {case.id}")    
+        if verbose:
+            print(f"Processing {filename} for Case ID: {case_id}")
 
         # Check if diagnosis already exists for this case/model/prompt (using LlmDiagnosis)
-        existing_diagnosis = session.query(LlmDiagnosis).filter_by(
-            cases_bench_id=case.id,
-            model_id=model_id,
-            prompt_id=prompt_id
-        ).first()
-
-        if existing_diagnosis:
-            print(f"    LlmDiagnosis already exists for {filename} (Case ID: {case.id}, Model ID: {model_id}, Prompt ID: {prompt_id}), skipping.")
+        if case_id in existing_case_ids:
+            if verbose:
+                print(f"    LlmDiagnosis already exists for {filename} (Case ID: {case_id}, Model ID: {model_id}, Prompt ID: {prompt_id}), skipping.")
             files_processed += 1
             continue
+        existing_case_ids.add(case_id)
+        to_read.append((filename, case_id))
 
-        # Read the prediction from JSON
-        file_path = os.path.join(dir_path, filename)
-        try:
-            with open(file_path, 'r', encoding='utf-8-sig') as f: # Note encoding
-                data = json.load(f)
-        except Exception as e:
-            print(f"    Error reading or parsing JSON {filename}: {str(e)}")  
+    # Read the predictions concurrently (file I/O, orjson decoding); rows are built in listing order
+    file_paths = [os.path.join(dir_path, filename) for filename, _ in to_read]
+    with ThreadPoolExecutor(max_workers=MAX_LOADING_WORKERS) as executor:
+        loaded = list(executor.map(read_patient_json, file_paths))
+
+    for (filename, case_id), (data, error) in zip(to_read, loaded):
+        if error is not None:
+            print(f"    Error reading or parsing JSON {filename}: {str(error)}")  
             continue 
 
         predict_diagnosis = data.get("predict_diagnosis", "")
         if not predict_diagnosis:
-            print(f"    No 'predict_diagnosis' key found in {filename}, skipping")
+            if verbose:
+                print(f"    No 'predict_diagnosis' key found in {filename}, skipping")
             files_processed += 1
             continue
         
-        # Add the new diagnosis to the database (using LlmDiagnosis)
-        llm_diagnosis = LlmDiagnosis(
-            cases_bench_id=case.id,
-            model_id=model_id,
-            prompt_id=prompt_id,
-            diagnosis=predict_diagnosis, # Store the full text
-            timestamp=datetime.datetime.now()
-        )
-        session.add(llm_diagnosis)
-        session.commit() # Commit after adding diagnosis
+        # Queue the new diagnosis (using LlmDiagnosis)
+        new_rows.append({
+            "cases_bench_id": case_id,
+            "model_id": model_id,
+            "prompt_id": prompt_id,
+            "diagnosis": predict_diagnosis, # Store the full text
+            "timestamp": timestamp
+        })
         
-        print(f"    Added LlmDiagnosis for {filename} (Case ID: {case.id}) -> LlmDiagnosis ID: {llm_diagnosis.id}")
+        if verbose:
+            print(f"    Queued LlmDiagnosis for {filename} (Case ID: {case_id})")
         diagnoses_added += 1
         
         files_processed += 1
+
+    # One executemany INSERT and a single commit for the whole directory
+    if new_rows:
+        try:
+            session.execute(insert(LlmDiagnosis), new_rows)
+            session.commit()
+        except Exception as e:
+            print(f"  Error adding {len(new_rows)} LlmDiagnosis rows for {dir_name}: {e}")
+            session.rollback()
+            return 0
     
     print(f"  Completed directory {dir_name}. Processed {files_processed} files, added {diagnoses_added} new LlmDiagnosis records.")
     return diagnoses_added
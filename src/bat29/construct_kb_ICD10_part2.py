@@ -19,6 +19,11 @@ INPUT_FILE_PATH = INPUT_DIR_RELATIVE + INPUT_FILE_NAME
 # Output directory for the generated mapping files
 OUTPUT_DIR = "mappings"
 
+# Order-file line: id, code, level, label and description separated by 2+ spaces;
+# the fallback handles labels that fill the 61-character column with no gap
+ORDER_LINE_RE = re.compile(r'^(\d{5})\s+([A-Z0-9]+)\s+(\d)\s+(.+?)\s{2,}(.+)$')
+ORDER_LINE_FIXED_WIDTH_RE = re.compile(r'^(\d{5})\s+([A-Z0-9]+)\s+(\d)\s+(.{61})(.+)$')
+
 # --- Functions ---
 
 def parse_line(line, verbose=False):
@@ -33,8 +38,7 @@ def parse_line(line, verbose=False):
         tuple: A tuple containing (id_code, icd_code, level, label, description) 
                if parsing is successful, otherwise None.
     """
-    pattern = r'^(\d{5})\s+([A-Z0-9]+)\s+(\d)\s+(.+?)\s{2,}(.+)$'
-    match = re.match(pattern, line)
+    match = ORDER_LINE_RE.match(line)
     if match:
         id_code, icd_code, level, label, description = match.groups()
         if verbose:
@@ -42,8 +46,7 @@ def parse_line(line, verbose=False):
             
         return id_code, icd_code, level, label, description
 
-    pattern = r'^(\d{5})\s+([A-Z0-9]+)\s+(\d)\s+(.{61})(.+)$'
-    match = re.match(pattern, line)
+    match = ORDER_LINE_FIXED_WIDTH_RE.match(line)
     if match:
         id_code, icd_code, level, label, description = match.groups()
         if verbose:
@@ -1,11 +1,3 @@
-import __init__
-import json
-from utils.helper_functions import clean_and_validate_disease_names
-import os
-
-##TODO:
-# Add docstrings and comments
-
 """
 Script to construct knowledge base mappings for OMIM and HPO data.
 
@@ -15,6 +7,13 @@ This script performs the following steps:
     3. Creates mappings for disease synonyms, name to HPO, and name to disease.
     4. Saves the updated mappings back to JSON files.
 """
+import __init__
+import json
+from utils.helper_functions import clean_and_validate_disease_names
+import os
+
+##TODO:
+# Add docstrings and comments
 
 # Define the directory containing mapping files
 mappings_dir = r'..\..\knowledge_base\mappings'
@@ -10,6 +10,7 @@ sys.path.append(path2add)
 import json
 import pandas as pd
 import glob
+from ast import literal_eval
 
 from utils.helper_functions import clean_and_validate_disease_names, load_json
 
@@ -48,12 +49,29 @@ if len(df_scores) != len(df_reconstructed):
 
 df_scores.index = df_reconstructed.index
 
+# Many patients share the same GT cell, so each distinct cell is parsed once.
+# Parsed names are kept as interned tuples: identical names across patients share one string.
+_gt_cache = {}
+
+def parse_gt(gt_cell):
+    """Parse a GT cell (a Python list literal) into a tuple of interned names, cached by raw cell."""
+    names = _gt_cache.get(gt_cell)
+    if names is None:
+        # literal_eval parses the cell without executing code; failures are not cached
+        names = tuple(sys.intern(name) if isinstance(name, str) else name for name in literal_eval(gt_cell))
+        _gt_cache[gt_cell] = names
+    return names
+
 results_list = [] # Initialize list to store results
 disease2name_juanjo = {}
 for index, row in df_reconstructed.iterrows():
     score_row = df_scores.loc[index]
     
-    disease_name = eval(score_row['GT'])
+    try:
+        disease_name = parse_gt(score_row['GT'])
+    except (ValueError, SyntaxError):
+        print(f"Warning: Could not parse GT for patient {index}: {score_row['GT']}")
+        disease_name = []
     if len(disease_name) == 0:
         print("not name found")
         
@@ -84,7 +102,6 @@ for index, row in df_reconstructed.iterrows():
 
         if not disease_id:
             print(f"Warning: Disease name not found in mapping: {i}")
-            input()
         disease_ids.append(disease_id)
         if "POEMS" in i:
             i = "POEMS (also known as Crow-Fukase syndrome or Takatsuki syndrome or Polyneuropathy, organomegaly, endocrinopathy, monoclonal gammopathy, and skin changes syndrome)"
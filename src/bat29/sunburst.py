@@ -115,7 +115,7 @@ def main():
 
     print("\nPreparing data for Sunburst chart...")
     plotly_data = {'ids': [], 'labels': [], 'parents': [], 'values': []}
-    processed_ids = set() # To avoid adding intermediate nodes multiple times
+    processed_ids = {} # id -> position in plotly_data, to avoid adding intermediate nodes multiple times
 
     # Add root node for clarity (optional but good practice)
     # plotly_data['ids'].append('root')
@@ -141,16 +141,12 @@ def main():
                 # Assign value ONLY if it's a leaf node in *this specific path*
                 # Plotly sums up parent values automatically
                 plotly_data['values'].append(count if i == len(path_tuple) - 1 else 0)
-                processed_ids.add(current_id)
+                processed_ids[current_id] = len(plotly_data['ids']) - 1
             else:
                  # If it's an existing intermediate node but also a leaf for THIS path, add its value
+                 # (looked up by position instead of a linear ids.index() scan)
                  if i == len(path_tuple) - 1:
-                     try:
-                         idx = plotly_data['ids'].index(current_id)
-                         plotly_data['values'][idx] += count
-                     except ValueError:
-                          # This should not happen if processed_ids logic is correct
-                          print(f"Error: ID {current_id} was marked processed but not found.")
+                     plotly_data['values'][processed_ids[current_id]] += count
 
 
     # 4. Create and Save the Sunburst Chart
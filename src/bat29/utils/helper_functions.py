@@ -212,6 +212,12 @@ def do_diagnostico(juicio_diagnostico, icd10_code = None, icd10code2name = None,
 
     return str1 
 
+# Accented vowels, ñ and ç to ASCII, applied in one str.translate pass instead of 22 chained replace() calls
+ACCENT_TRANSLATION = str.maketrans({
+    **dict.fromkeys('áàâä', 'a'), **dict.fromkeys('éèêë', 'e'), **dict.fromkeys('íìîï', 'i'),
+    **dict.fromkeys('óòôö', 'o'), **dict.fromkeys('úùûü', 'u'), 'ñ': 'nh', 'ç': 'c'
+})
+
 def clean_and_validate_disease_names(raw_names_string):
     # if "desmino" in raw_names_string.lower():
     #     print(raw_names_string)
@@ -223,13 +229,10 @@ def clean_and_validate_disease_names(raw_names_string):
         if not name:
             continue
 
-        name = name.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-        name = name.replace('à', 'a').replace('è', 'e').replace('ì', 'i').replace('ò', 'o').replace('ù', 'u')
-        name = name.replace('â', 'a').replace('ê', 'e').replace('î', 'i').replace('ô', 'o').replace('û', 'u')
-        name = name.replace('ä', 'a').replace('ë', 'e').replace('ï', 'i').replace('ö', 'o').replace('ü', 'u')
-        name = name.replace('ñ', 'nh').replace('ç', 'c')
+        name = name.translate(ACCENT_TRANSLATION)
 
-        if any(ord(c) > 127 for c in name):
+        # Names with any other non-ASCII character (e.g. Chinese) are dropped
+        if not name.isascii():
             continue
         name_split = name.split(" ")
         if name_split[-1] == "and":
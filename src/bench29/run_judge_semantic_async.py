@@ -92,10 +92,11 @@ if __name__ == "__main__":
         print(line, end='')
     
     # Stream stderr
-    stderr_output = ""
+    stderr_chunks = [] # Joined once at the end instead of repeated string concatenation
     for line in process.stderr:
-        stderr_output += line
+        stderr_chunks.append(line)
         print(line, end='', file=sys.stderr) # Print errors to stderr as they come
+    stderr_output = "".join(stderr_chunks)
 
     process.wait() # Wait for the subprocess to finish
     print("--- End Output ---")
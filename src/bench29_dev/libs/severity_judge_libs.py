@@ -263,8 +263,10 @@ def save_severity_to_database(
         
         # Import models
         from db.bench29.bench29_models import DifferentialDiagnosis2Severity
+        from db.utils.db_utils import bulk_insert
         
-        # Save each evaluation
+        # Collect one row per evaluation, then insert them all at once
+        severity_rows = []
         for evaluation in severity_evaluations:
             disease_name = evaluation.get("disease", "")
             severity_name = evaluation.get("severity", "").lower()
@@ -277,17 +279,17 @@ def save_severity_to_database(
                 # Default to moderate if unknown
                 severity_id = severity_levels.get("moderate", {"id": 2})["id"]
                 
-            # Create record
-            severity_record = DifferentialDiagnosis2Severity(
-                cases_bench_id=case_id,
-                differential_diagnosis_id=llm_diagnosis_id,
-                severity_levels_id=severity_id
-            )
-            
-            session.add(severity_record)
-            session.flush()  # Get ID without committing
+            severity_rows.append({
+                "cases_bench_id": case_id,
+                "differential_diagnosis_id": llm_diagnosis_id,
+                "severity_levels_id": severity_id
+            })
             
-            created_ids.append(severity_record.id)
+        # One executemany with RETURNING instead of a flush per record to get each ID
+        created_ids = bulk_insert(
+            session, DifferentialDiagnosis2Severity, severity_rows,
+            returning=DifferentialDiagnosis2Severity.id
+        )
             
         # Commit all changes
         session.commit()
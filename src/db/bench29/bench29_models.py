@@ -9,7 +9,7 @@ import sys
 # Adjust the system path to include the parent directory
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../'))
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKeyConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKeyConstraint, UniqueConstraint
 from datetime import datetime
 from db.db_conf import Base
 
@@ -37,7 +37,7 @@ class CasesBench(Base):
     meta_data = Column(JSON)
     processed_date = Column(DateTime)
     source_type = Column(String(255))
-    source_file_path = Column(Text)
+    source_file_path = Column(Text, index=True)  # Cases are looked up by patient file name
 
 
 class CasesBenchMetadata(Base):
@@ -51,6 +51,7 @@ class CasesBenchMetadata(Base):
         ForeignKeyConstraint(['severity_levels_id'], ['registry.severity_levels.id'], ondelete='SET NULL'),
         ForeignKeyConstraint(['predicted_by'], ['llm.models.id'], ondelete='SET NULL'),
         ForeignKeyConstraint(['complexity_level_id'], ['registry.complexity_levels.id'], ondelete='SET NULL'),
+        UniqueConstraint('cases_bench_id', name='uq_cases_bench_metadata_case'),
         {'schema': 'bench29'},
     )
 
@@ -92,6 +93,7 @@ class CasesBenchDiagnosis(Base):
     __tablename__ = 'cases_bench_diagnosis'
     __table_args__ = (
         ForeignKeyConstraint(['cases_bench_id'], ['bench29.cases_bench.id'], ondelete='CASCADE'),
+        UniqueConstraint('cases_bench_id', name='uq_cases_bench_diagnosis_case'),
         {'schema': 'bench29'},
     )
 
@@ -111,6 +113,7 @@ class LlmDifferentialDiagnosis(Base):
         ForeignKeyConstraint(['cases_bench_id'], ['bench29.cases_bench.id'], ondelete='CASCADE'),
         ForeignKeyConstraint(['model_id'], ['llm.models.id'], ondelete='CASCADE'),
         ForeignKeyConstraint(['prompt_id'], ['prompts.prompt.id'], ondelete='CASCADE'),
+        UniqueConstraint('cases_bench_id', 'model_id', 'prompt_id', name='uq_differential_diagnosis_case_model_prompt'),
         {'schema': 'bench29'},
     )
 
@@ -1,9 +1,12 @@
-from sqlalchemy import exists
+from sqlalchemy import exists, select, lambda_stmt
 
 def get_model_id(session, model_name):
     """
     Get model ID from database by alias.
     
+    The statement is built with lambda_stmt, so SQLAlchemy compiles it once and
+    only re-binds `model_name` on subsequent calls.
+    
     Args:
         session: SQLAlchemy session
         model_name: Model alias to look for
@@ -12,10 +15,8 @@ def get_model_id(session, model_name):
         Integer ID of the model or None if not found
     """
     from db.llm.llm_models import Models
-    model = session.query(Models).filter(Models.alias == model_name).first()
-    if model:
-        return model.id
-    return None
+    stmt = lambda_stmt(lambda: select(Models.id).where(Models.alias == model_name).limit(1))
+    return session.execute(stmt).scalar()
 
 def add_model(session, model_name):
     """
@@ -56,6 +56,22 @@ def create_indexes():
         """CREATE INDEX IF NOT EXISTS idx_differential_diagnosis_case_model 
            ON bench29.llm_differential_diagnosis(cases_bench_id, model_id)""",
         
+        # Unique key backing ON CONFLICT DO NOTHING inserts of differential diagnoses
+        """CREATE UNIQUE INDEX IF NOT EXISTS uq_differential_diagnosis_case_model_prompt 
+           ON bench29.llm_differential_diagnosis(cases_bench_id, model_id, prompt_id)""",
+        
+        # Unique keys backing ON CONFLICT (cases_bench_id) DO NOTHING inserts of gold diagnoses
+        # and metadata (bat29 queries2.process_csv_file). create_all does not add these to
+        # existing tables. Remove duplicate rows first, or the index creation fails, e.g.:
+        #   DELETE FROM bench29.cases_bench_diagnosis a USING bench29.cases_bench_diagnosis b
+        #   WHERE a.cases_bench_id = b.cases_bench_id AND a.id > b.id;
+        # (and likewise for bench29.cases_bench_metadata)
+        """CREATE UNIQUE INDEX IF NOT EXISTS uq_cases_bench_diagnosis_case 
+           ON bench29.cases_bench_diagnosis(cases_bench_id)""",
+        
+        """CREATE UNIQUE INDEX IF NOT EXISTS uq_cases_bench_metadata_case 
+           ON bench29.cases_bench_metadata(cases_bench_id)""",
+        
         """CREATE INDEX IF NOT EXISTS idx_rank_case_diagnosis 
            ON bench29.differential_diagnosis_to_rank(cases_bench_id, differential_diagnosis_id)""",
         
@@ -68,7 +84,7 @@ def create_indexes():
     try:
         for index in indexes:
             engine.execute(text(index))
-            print(f"Created index: {index.split('CREATE INDEX IF NOT EXISTS')[1].split('ON')[0].strip()}")
+            print(f"Created index: {index.split('IF NOT EXISTS')[1].split('ON')[0].strip()}")
         
         print("\nAll indexes created successfully!")
         print("\nNote: Run analyze_tables.py to update database statistics for optimal query performance")
@@ -23,7 +23,7 @@
 # 6.  Record Creation: Instantiate the appropriate SQLAlchemy model using the filtered `data_dict`.
 # 7.  Database Operation:
 #     - Use a `try...except` block.
-#     - Inside `try`: `session.add(new_record)`, `session.commit()`, `session.flush()` (to get the ID).
+#     - Inside `try`: `session.add(new_record)`, `session.commit()` (which flushes, so the ID is assigned).
 #     - If successful, print a message (if `verbose`) and return the `new_record.id`.
 #     - Inside `except`: `session.rollback()`, print an error message, and return `False`.
 
@@ -148,7 +148,6 @@ def add_case_metadata(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()  # Ensure the ID is populated
         if verbose:
             print(f"    Added metadata for case ID {cases_bench_id} (ID: {new_record.id})")
         return new_record.id
@@ -220,7 +219,6 @@ def add_cases_bench(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added CasesBench record for {source_file_path} (ID: {new_record.id})")
         return new_record.id
@@ -272,7 +270,6 @@ def add_cases_bench_diagnosis(session, case_id, gold_diagnosis, alternative_diag
     try:
         session.add(new_diagnosis)
         session.commit()
-        session.flush()  # Flush to get the ID
         
         if verbose:
             print(f"    Added golden diagnosis for case ID {case_id}")
@@ -337,7 +334,6 @@ def add_cases_bench_gold_diagnosis(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added golden diagnosis for case ID {cases_bench_id} (ID: {new_record.id})")
         return new_record.id
@@ -405,7 +401,6 @@ def add_llm_differential_diagnosis(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added LlmDifferentialDiagnosis for case {cases_bench_id}, model {model_id}, prompt {prompt_id} (ID: {new_record.id})")
         return new_record.id
@@ -469,7 +464,6 @@ def add_differential_diagnosis_to_rank(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added rank {rank_position} for diagnosis ID {differential_diagnosis_id} (ID: {new_record.id})")
         return new_record.id
@@ -536,7 +530,6 @@ def add_llm_analysis(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added LlmAnalysis for diagnosis ID {differential_diagnosis_id} (ID: {new_record.single_differential_diagnosis_id})")
         # Return the actual primary key value
@@ -594,7 +587,6 @@ def add_differential_diagnosis_to_severity(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added severity association for diagnosis ID {differential_diagnosis_id} (ID: {new_record.id})")
         return new_record.id
@@ -651,7 +643,6 @@ def add_differential_diagnosis_to_semantic_relationship(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added semantic relationship association for diagnosis ID {differential_diagnosis_id} (ID: {new_record.id})")
         return new_record.id
@@ -79,7 +79,6 @@ def add_models(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added Model record '{name}' (Alias: {alias or 'N/A'}, ID: {new_record.id})")
         return new_record.id
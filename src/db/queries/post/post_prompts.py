@@ -53,7 +53,6 @@ def add_user(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added User record for '{name}' (ID: {new_record.id})")
         return new_record.id
@@ -100,7 +99,6 @@ def add_prompt(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added Prompt record for alias '{alias}' (ID: {new_record.id})")
         return new_record.id
@@ -134,7 +132,6 @@ def add_relationship_type(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added RelationshipType record for '{type_name}' (ID: {new_record.id})")
         return new_record.id
@@ -180,7 +177,6 @@ def add_prompt_relationship(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added PromptRelationship record {from_prompt_id} -> {to_prompt_id} (ID: {new_record.id})")
         return new_record.id
@@ -223,7 +219,6 @@ def add_prompt_arguments(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added PromptArguments record for prompt ID {prompt_id} (ID: {new_record.id})")
         return new_record.id
@@ -269,7 +264,6 @@ def add_prompt_template(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added PromptTemplate record for prompt ID {prompt_id} (ID: {new_record.id})")
         return new_record.id
@@ -326,7 +320,6 @@ def add_prompt_metrics(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added PromptMetrics record for prompt {prompt_id}, model {model_id} (ID: {new_record.id})")
         return new_record.id
@@ -369,7 +362,6 @@ def add_prompt_vector(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added PromptVector record for prompt ID {prompt_id} (ID: {new_record.id})")
         return new_record.id
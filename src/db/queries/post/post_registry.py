@@ -66,7 +66,6 @@ def add_severity_levels(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added SeverityLevel record for '{name}' (ID: {new_record.id})")
         return new_record.id
@@ -115,7 +114,6 @@ def add_complexity_levels(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added ComplexityLevel record for '{name}' (ID: {new_record.id})")
         return new_record.id
@@ -166,7 +164,6 @@ def add_diagnosis_semantic_relationship(
     try:
         session.add(new_record)
         session.commit()
-        session.flush()
         if verbose:
             print(f"    Added DiagnosisSemanticRelationship record for '{semantic_relationship}' (ID: {new_record.id})")
         return new_record.id
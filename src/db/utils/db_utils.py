@@ -3,12 +3,42 @@ Database utilities module for establishing connections to the database
 and creating sessions for database operations.
 """
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, insert, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import inspect
 import json
 import os
 
+# orjson is optional; dumps_json falls back to the stdlib without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(value):
+    """
+    Serialize a JSON column value, with orjson when it is installed.
+
+    Used by bat29 queries.copy_cases_rows to encode CasesBench.meta_data for
+    COPY and for its executemany fallback; it can also be passed as create_engine's
+    json_serializer (engine_kwargs). Values orjson cannot encode (e.g. integers
+    wider than 64 bits) fall back to json.dumps.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(value)
+
+
+# Session options for batch code that only queries, inserts through Core statements and
+# commits (e.g. process_csv_file in bat29 queries2): no autoflush before every query and
+# no re-SELECT of attributes after every commit. Not suitable for code that relies on
+# session.add() being visible to a later query; check each path before passing it.
+BATCH_SESSION_KWARGS = {"autoflush": False, "expire_on_commit": False}
+
 
 def get_session(
     username="dummy_user", 
@@ -19,7 +49,9 @@ def get_session(
     schema=None,
     verbose=True, 
     base=None, 
-    get_engine=False
+    get_engine=False,
+    engine_kwargs=None,
+    session_kwargs=None
 ):
     """
     Create a database connection and session, with optional schema and table creation.
@@ -34,15 +66,18 @@ def get_session(
         verbose (bool): Whether to print connection information
         base (declarative_base): SQLAlchemy Base class for table definitions
         get_engine (bool): Whether to return the engine along with the session
+        engine_kwargs (dict, optional): Extra create_engine arguments (e.g. pool_size for
+            threads sharing one engine, or json_serializer=dumps_json for JSON-heavy bulk inserts)
+        session_kwargs (dict, optional): Extra sessionmaker arguments (e.g. BATCH_SESSION_KWARGS)
         
     Returns:
         If get_engine is True, returns (engine, session), otherwise returns session
     """
     # Create engine with the connection string
-    engine = create_engine(f'postgresql://{username}:{password}@{host}/{db_name}')
+    engine = create_engine(f'postgresql://{username}:{password}@{host}/{db_name}', **(engine_kwargs or {}))
     
     # Create session factory
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=engine, **(session_kwargs or {}))
     
     # Create session
     session = Session()
@@ -73,6 +108,33 @@ def get_session(
     
     return session
 
+def bulk_insert(session, model, rows, page_size=1000, returning=None):
+    """
+    Insert many rows in one executemany call instead of one session.add() per row.
+
+    SQLAlchemy 2.0 sends the rows as multi-row INSERT ... VALUES statements of
+    page_size rows each (insertmanyvalues), so N rows cost about N / page_size
+    round trips. page_size overrides the engine's insertmanyvalues_page_size.
+    Nothing is committed; the caller commits.
+
+    Args:
+        session: SQLAlchemy session
+        model: Mapped class to insert into
+        rows (list[dict]): Column values per row, keyed by attribute name
+        page_size (int): Rows per INSERT statement
+        returning (Column, optional): Column to return for each row, e.g. model.id
+
+    Returns:
+        list: The returning column values in the order of rows, or [] when returning is None
+    """
+    if not rows:
+        return []
+    stmt = insert(model).execution_options(insertmanyvalues_page_size=page_size)
+    if returning is None:
+        session.execute(stmt, rows)
+        return []
+    return list(session.scalars(stmt.returning(returning, sort_by_parameter_order=True), rows))
+
 def jsonline2dict(line, columns=None, line_num=None, verbose=False, deep_verbose=False):
     """
     Convert a JSON line to a filtered dictionary based on valid columns.
@@ -157,20 +219,18 @@ def upload_jsonl(table_obj, fname, dirname=None, schema=None):
                 input("Press Enter to continue")
                 break
             
-            # Create new instance of the table object
-            record = table_obj(**data)
-            batch.append(record)
+            batch.append(data)
             
             # Batch insert every 1000 records
             if len(batch) >= 1000:
-                session.bulk_save_objects(batch)
+                bulk_insert(session, table_obj, batch)
                 session.commit()
                 records_inserted += len(batch)
                 batch = []
         
         # Insert any remaining records
         if batch:
-            session.bulk_save_objects(batch)
+            bulk_insert(session, table_obj, batch)
             session.commit()
             records_inserted += len(batch)
     
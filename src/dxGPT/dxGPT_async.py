@@ -9,18 +9,19 @@ from sqlalchemy.orm import Session # Explicit Session import
 
 from lapin.handlers.async_base_handler import AsyncModelHandler
 from lapin.utils.async_batch import process_all_batches
+from lapin.conf.base_conf import CONFIG_REGISTRY
 
 # --- Centralized DB Query Imports ---
 from db.utils.db_utils import get_session
-from db.queries.get.get_bench29 import get_cases_bench
 from db.queries.get.get_llm import get_models
 from db.queries.other.other_bench29 import insert_or_fetch_model, insert_or_fetch_prompt
-from dxGPT.queries.dxGPT_queries import add_batch_differential_diagnoses
+from dxGPT.queries.dxGPT_queries import add_batch_differential_diagnoses, fetch_cases_from_db
 
 
 # --- dxGPT Specific Imports ---
 from dxGPT.parsers.dxGPT_parsers import PARSER_DIFFERENTIAL_DIAGNOSES, PARSER_DIFFERENTIAL_DIAGNOSES_RANKS # Adjust if parser structure differs
-from dxGPT.utils.text_conversion import DxGPTInputWrapper, wrap_prompts
+from dxGPT.utils.text_conversion import DxGPTInputWrapper, AggregatedResult, wrap_prompts
+from dxGPT.utils.response_cache import ResponseCache
 # Import the registry
 from dxGPT.prompts.dxGPT_prompts import DXGPT_PROMPT_REGISTRY
 
@@ -43,9 +44,10 @@ def set_settings(prompt_alias: str, model_alias: str) -> tuple[Session, AsyncMod
         The prompt builder is loaded dynamically using the DXGPT_PROMPT_REGISTRY.
     """
 
+    # One session for the whole run: id lookups, case fetch and batch insertion share it
+    session = get_session()
     model_id = insert_or_fetch_model(session, model_alias)
     prompt_id = insert_or_fetch_prompt(session, prompt_alias)
-    session = get_session()
     handler = AsyncModelHandler() # Initialize without explicit config
 
     # Load prompt builder using the registry
@@ -93,38 +95,81 @@ def retrieve_and_make_prompts(
             - List of DxGPTInputWrapper objects ready for batching.
             - The model_id for the given model_alias.
     """
-    # Get Model ID using centralized query
-
-    # Fetch cases using centralized query
-    
-    cases = get_cases_bench(session=session, hospital=filter_hospital)
-
-    if not cases:
-        raise ValueError(f"No cases found for hospital '{hospital_name}'.")
-    # Apply limit *after* fetching, as get_cases_bench doesn't have direct limit
-    if num_samples and len(cases) > num_samples:
-        cases = cases[:num_samples]
-        if verbose:
-            print(f"Limiting to {num_samples} cases.")
-    if verbose:
-        print(f"Fetched {len(cases)} cases for processing.")
+    # Stream cases; hospital filter and limit are applied in SQL
+    cases = fetch_cases_from_db(session, hospital=hospital_name, num_samples=num_samples)
 
-    # Build prompts and create wrappers using the new function
+    # Build prompts and create wrappers while rows arrive from the cursor
     input_wrappers = wrap_prompts(cases, model_id, prompt_id)
 
+    if not input_wrappers:
+        raise ValueError(f"No cases found for hospital '{hospital_name}'.")
     if verbose:
         print(f"Created {len(input_wrappers)} input wrappers for batch processing.")
 
     return input_wrappers
 
 
+def run_llm_batches(
+    input_wrappers: List[DxGPTInputWrapper],
+    prompt_builder: Any,
+    handler: AsyncModelHandler,
+    model_alias: str,
+    prompt_alias: str,
+    batch_size: int,
+    rpm_limit: int,
+    min_batch_interval: float,
+    verbose: bool,
+    cache: Optional[ResponseCache] = None
+) -> List[Dict[str, Any]]:
+    """Runs the LLM calls for the input wrappers, skipping cached responses.
+
+    With a `cache`, wrappers whose (model, prompt, template, generation params,
+    description) response is already cached are answered from it, only the
+    misses are sent through `process_all_batches`, and their successful
+    responses are stored.
+
+    Returns:
+        List of result dicts in the `process_all_batches` format.
+    """
+    cached_results = []
+    pending_wrappers = input_wrappers
+    if cache is not None:
+        # The template text and the model's sampling params are part of the key, so a
+        # changed template or temperature is not answered with an old response
+        config_cls = CONFIG_REGISTRY.get(model_alias)
+        generation_params = config_cls().get_params() if config_cls else None
+        context = ResponseCache.make_context(prompt_builder.prompt_template or prompt_builder.meta_template, generation_params)
+        cached_results, pending_wrappers = cache.split(input_wrappers, model_alias, prompt_alias, context)
+
+    results = []
+    if pending_wrappers:
+        results = asyncio.run(process_all_batches(
+            items=pending_wrappers,
+            prompt_template=prompt_builder, # Pass builder instance (REQUIRED by lapin)
+            handler=handler,
+            model=model_alias, # Pass model alias to handler
+            text_attr="text",
+            id_attr="id",
+            batch_size=batch_size,
+            rpm_limit=rpm_limit,
+            min_batch_interval=min_batch_interval,
+            verbose=verbose,
+            # Pass original_item_attr if needed by process_all_batches version
+            # original_item_attr='original_item' # Assuming it attaches the wrapper here
+        ))
+        if cache is not None:
+            cache.store(results, pending_wrappers, model_alias, prompt_alias, context)
+
+    return cached_results + results
+
+
 def process_results(
     results: List[Dict[str, Any]],
     prompt_alias: str,
     input_wrappers: List[DxGPTInputWrapper],
     session: Session, # Keep session for signature consistency, though unused
     verbose: bool
-) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: # Return aggregated data and failure details
+) -> tuple[List[AggregatedResult], List[Dict[str, Any]]]: # Return aggregated data and failure details
     """Processes LLM results, parses diagnoses, and aggregates data for batch insertion.
 
     Handles API and parsing errors. Aggregates successfully parsed data and
@@ -138,7 +183,7 @@ def process_results(
 
     Returns:
         tuple:
-            - aggregated_data (List[Dict]): List of dicts for successful results.
+            - aggregated_data (List[AggregatedResult]): One entry per successful result.
             - failed_item_details (List[Dict]): List of dicts detailing failed items.
     """
     if verbose:
@@ -167,7 +212,7 @@ def process_results(
         if not result.get("success"):
             failure_reason = "API Error"
             failure_details = result.get('error', 'Unknown API error')
-            print(f"[WARN] {failure_reason} for {item_id}: {failure_details}. Skipping.")
+            logger.warning("%s for %s: %s. Skipping.", failure_reason, item_id, failure_details)
             failed_item_details.append({
                 "item_id": item_id,
                 "reason": failure_reason,
@@ -213,27 +258,26 @@ def process_results(
         
         if not differential_diagnoses_ranks: # Includes None or empty list
             # This case is logged but not treated as a hard failure unless specified
-            print(f"[WARN] Ranks parser returned no diagnoses for item {item_id}. Raw response:\n{raw_response[:200]}..., check parser and prompt")
+            logger.warning("Ranks parser returned no diagnoses for item %s, check parser and prompt. Raw response:\n%.200s...", item_id, raw_response)
             # We will simply not add it to aggregated_data below
             continue # Skip aggregation for this item
 
         # --- Aggregation on Success ---
         # Only reached if API succeeded AND both parsing stages yielded a non-empty list of ranks
-        data_item = {
-            "case_id": case_id,
-            "model_id": model_id,
-            "prompt_id": prompt_id,
-            "differential_diagnoses": differential_diagnoses,
-            "differential_diagnoses_ranks": differential_diagnoses_ranks # Store the list of tuples
-        }
+        data_item = AggregatedResult(
+            case_id=case_id,
+            model_id=model_id,
+            prompt_id=prompt_id,
+            differential_diagnoses=differential_diagnoses,
+            differential_diagnoses_ranks=differential_diagnoses_ranks # Store the list of tuples
+        )
         aggregated_data.append(data_item)
 
     # --- Final Summary (within process_results) ---
-    print("\n--- Result Processing Summary ---")
-    print(f"Total results received: {len(results)}")
-    print(f"Successfully parsed items (with >0 ranks): {len(aggregated_data)}")
-    print(f"Items skipped due to API/Config/Parsing errors: {len(failed_item_details)}")
-    print("-------------------------------")
+    logger.info(
+        "Result processing summary: results received=%s, parsed items (with >0 ranks)=%s, skipped due to API/Config/Parsing errors=%s",
+        len(results), len(aggregated_data), len(failed_item_details)
+    )
 
     return aggregated_data, failed_item_details # Return aggregated data and failure list
 
@@ -245,7 +289,7 @@ def main_async(args: argparse.Namespace):
     1. Extracts parameters from command-line arguments.
     2. Calls `set_settings` to initialize DB, handler, and prompt builder.
     3. Calls `retrieve_and_make_prompts` to get cases and prepare input wrappers.
-    4. Calls `lapin.utils.async_batch.process_all_batches` to run LLM calls.
+    4. Calls `run_llm_batches` to run LLM calls (answering cache hits first if --use_cache).
     5. Calls `process_results` to parse and store results.
     6. Closes the database session.
     Does not load lapin configuration explicitly.
@@ -261,6 +305,7 @@ def main_async(args: argparse.Namespace):
     batch_size = args.batch_size
     rpm_limit = args.rpm_limit
     min_batch_interval = args.min_batch_interval
+    use_cache = getattr(args, "use_cache", False)
 
     if not model_alias:
         raise ValueError("Model alias must be provided via --model argument or config.")
@@ -293,20 +338,21 @@ def main_async(args: argparse.Namespace):
     if verbose: print(f"Starting batch processing for {len(input_wrappers)} items...")
     start_batch_time = time.time()
 
-    results = asyncio.run(process_all_batches(
-        items=input_wrappers,
-        prompt_template=prompt_builder, # Pass builder instance (REQUIRED by lapin)
+    cache = ResponseCache(verbose=verbose) if use_cache else None
+    results = run_llm_batches(
+        input_wrappers=input_wrappers,
+        prompt_builder=prompt_builder,
         handler=handler,
-        model=model_alias, # Pass model alias to handler
-        text_attr="text",
-        id_attr="id",
+        model_alias=model_alias,
+        prompt_alias=prompt_alias,
         batch_size=batch_size,
         rpm_limit=rpm_limit,
         min_batch_interval=min_batch_interval,
         verbose=verbose,
-        # Pass original_item_attr if needed by process_all_batches version
-        # original_item_attr='original_item' # Assuming it attaches the wrapper here
-    ))
+        cache=cache
+    )
+    if cache is not None:
+        cache.close()
     end_batch_time = time.time()
     if verbose: print(f"Batch processing completed in {end_batch_time - start_batch_time:.2f} seconds.")
 
@@ -336,7 +382,7 @@ def main_async(args: argparse.Namespace):
 
     # --- Cleanup ---
     if session and not session_closed:
-        # Note: Commits are handled *inside* the centralized add_* functions.
+        # Note: add_batch_differential_diagnoses commits the whole batch once.
         # We only need to close the session here.
         if verbose: print("Closing database session.")
         session.close()
@@ -361,10 +407,13 @@ if __name__ == "__main__":
     parser.add_argument("--batch_size", type=int, default=10, help="Number of prompts per API call batch.")
     parser.add_argument("--rpm_limit", type=int, default=1000, help="Requests Per Minute limit for the API.")
     parser.add_argument("--min_batch_interval", type=float, default=5.0, help="Minimum time between batches (seconds).")
+    parser.add_argument("--use_cache", action='store_true', default=False, help="Reuse cached LLM responses for identical (model, prompt template, generation params, case) inputs. Off by default.")
     # Add --config_path if lapin.load_config needs it explicitly
     # parser.add_argument("--config_path", type=str, default="config/lapin_config.yaml", help="Path to lapin configuration file.")
     
     args = parser.parse_args()
+    # Batch summaries are logged at INFO; per-item warnings show at the default level.
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     # --- Mode Selection ---
     if args.model and args.prompt_alias:
@@ -383,6 +432,7 @@ if __name__ == "__main__":
         debug_batch_size = 5            # <<< SET DEBUG BATCH SIZE
         debug_rpm_limit = 1000
         debug_min_batch_interval = 10.0
+        debug_use_cache = False         # <<< SET True TO REUSE CACHED RESPONSES ACROSS DEBUG RUNS
         # --- End Hardcoded Settings ---
         prompt_alias = debug_prompt_alias
         start_run_time = time.time()
@@ -418,38 +468,32 @@ if __name__ == "__main__":
             print(f"Debug: Using model: {debug_model_alias} (ID: {model_id})")
             if model_id is None:
                 raise ValueError(f"Debug: Model with alias '{debug_model_alias}' not found.")
-        # Fetch cases
-        cases = get_cases_bench(session=session, hospital=debug_hospital)
-        if not cases:
-             raise ValueError(f"Debug: No cases found for hospital '{debug_hospital}'.")
-        else:
-            if debug_verbose: print(f"Debug: Fetched {len(cases)} cases.")
-
-        # Limit cases if requested
-        if debug_num_samples and len(cases) > debug_num_samples:
-            cases = cases[:debug_num_samples]
-            if debug_verbose: print(f"Debug: Limiting to {debug_num_samples} cases.")
-
-        # Prepare input wrappers
+        # Stream cases (limited to debug_num_samples in SQL) and prepare input wrappers
+        cases = fetch_cases_from_db(session, hospital=debug_hospital, num_samples=debug_num_samples, yield_per=debug_batch_size)
         input_wrappers = wrap_prompts(cases, model_id, prompt_id)
+        if not input_wrappers:
+             raise ValueError(f"Debug: No cases found for hospital '{debug_hospital}'.")
 
         if debug_verbose: print(f"Debug: Created {len(input_wrappers)} input wrappers.")
 
         if debug_verbose: print(f"Debug: Starting batch processing for {len(input_wrappers)} items...")
         start_batch_time = time.time()
         
-        results = asyncio.run(process_all_batches(
-                items=input_wrappers,
-                prompt_template=prompt_builder, # Pass builder instance (REQUIRED by lapin)
+        cache = ResponseCache(verbose=debug_verbose) if debug_use_cache else None
+        results = run_llm_batches(
+            input_wrappers=input_wrappers,
+            prompt_builder=prompt_builder,
             handler=handler,
-                model=debug_model_alias,
-            text_attr="text",
-            id_attr="id",
-                batch_size=debug_batch_size,
-                rpm_limit=debug_rpm_limit,
-                min_batch_interval=debug_min_batch_interval,
-                verbose=debug_verbose,
-            ))
+            model_alias=debug_model_alias,
+            prompt_alias=debug_prompt_alias,
+            batch_size=debug_batch_size,
+            rpm_limit=debug_rpm_limit,
+            min_batch_interval=debug_min_batch_interval,
+            verbose=debug_verbose,
+            cache=cache
+        )
+        if cache is not None:
+            cache.close()
 
 
 
@@ -8,14 +8,36 @@ import json
 
 logger = logging.getLogger(__name__)
 
-def universal_dif_diagnosis_parser(diagnosis_text: str | None, regex_number=r'^\s*(\d+)[\.\)\-]?\s*(.+)') -> list[tuple[int | None, str | None, str | None]]:
+# Patterns are compiled once at import instead of going through re's cache on every call
+# Diagnosis line (e.g. "+1.", "1.", "1)"): rank, name, optional reasoning after a colon
+# The colon is optional ("2. Cold" is a diagnosis line), so lines cannot be pre-filtered on ':';
+# a pure-Python scanner for this format measured slower than the compiled match, so it stays a regex.
+DIAGNOSIS_LINE_RE = re.compile(r'^\+?\s*(\d+)[\.\)\-]?\s*([^:]+)(?::\s*(.*))?$')
+TOP5_RE = re.compile(r"<top5>(.*?)</top5>", re.DOTALL)
+DIAGNOSIS_OUTPUT_RE = re.compile(r"<5_diagnosis_output>(.*?)</5_diagnosis_output>", re.DOTALL)
+DIGIT_RE = re.compile(r"\d")
+
+def starts_diagnosis_line(line: str) -> bool:
+    """Cheap prefix test for DIAGNOSIS_LINE_RE on a stripped, non-empty line.
+
+    A diagnosis line is an optional '+', optional whitespace, then a digit.
+    Reasoning lines almost never look like that, so they skip the regex.
+    """
+    first = line[0]
+    if first == '+':
+        rest = line[1:].lstrip()
+        return bool(rest) and rest[0].isdigit()
+    return first.isdigit()
+
+
+def universal_dif_diagnosis_parser(diagnosis_text: str | None, regex_number=None) -> list[tuple[int | None, str | None, str | None]]:
     """
     Parse diagnosis text to extract multiple potential diagnoses.
     Handles various numbered formats and extracts diagnosis names and reasoning.
 
     Args:
         diagnosis_text: The raw diagnosis text from the LLM. Can be None.
-        regex_number: Regex pattern for identifying numbered lines.
+        regex_number: Unused, kept for backwards compatibility; lines are matched with DIAGNOSIS_LINE_RE.
 
     Returns:
         list: A list of tuples, each containing (rank_position, diagnosis_name, reasoning).
@@ -28,37 +50,30 @@ def universal_dif_diagnosis_parser(diagnosis_text: str | None, regex_number=r'^\
 
     diagnoses = []
     
-    # Clean the text: replace escaped newlines and normalize spacing
-    try:
-        diagnosis_text = diagnosis_text.replace('\\n', '\n')
-        diagnosis_text = re.sub(r'\n{3,}', '\n\n', diagnosis_text) # Normalize excessive newlines
-    except Exception as e:
-        logger.error(f"Error during text cleaning: {e}")
-        return [] # Return empty if cleaning fails
+    # Clean the text: replace escaped newlines. Runs of blank lines are not collapsed
+    # with an extra pass over the text: the line loop below skips blank lines anyway.
+    diagnosis_text = diagnosis_text.replace('\\n', '\n')
+
+    # Each line is stripped once here; blank lines are dropped
+    lines = [line for line in (raw.strip() for raw in diagnosis_text.splitlines()) if line]
 
-    lines = diagnosis_text.strip().split('\n')
-    
     current_diagnosis = None
     current_rank = None
+    # Entries are stripped and non-empty, so their join needs no further strip()
     current_reasoning_lines = []
 
-    # Regex to find potential diagnosis lines (e.g., "+1.", "1.", "1)")
-    # Modified to handle '+' optionally and various separators/endings
-    # Also captures potential diagnosis name and initial reasoning after a colon
-    diagnosis_pattern = r'^\+?\s*(\d+)[\.\)\-]?\s*([^:]+)(?::\s*(.*))?$'
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-
-        match = re.match(diagnosis_pattern, line)
+    # Every diagnosis line has a rank digit; free-text answers without any digit
+    # skip the line scan and go straight to the single-diagnosis fallback below
+    for line in (lines if DIGIT_RE.search(diagnosis_text) else ()):
+        # Potential diagnosis line (e.g., "+1.", "1.", "1)"), see DIAGNOSIS_LINE_RE;
+        # the regex only runs on lines that pass the prefix test
+        match = DIAGNOSIS_LINE_RE.match(line) if starts_diagnosis_line(line) else None
 
         if match:
             # Found a potential new diagnosis line
             # First, save the previous diagnosis if one was being processed
             if current_diagnosis is not None:
-                reasoning = "\n".join(current_reasoning_lines).strip() if current_reasoning_lines else None
+                reasoning = "\n".join(current_reasoning_lines) if current_reasoning_lines else None
                 diagnoses.append((current_rank, current_diagnosis, reasoning))
                 logger.debug(f"Saved diagnosis: Rank={current_rank}, Name={current_diagnosis}")
 
@@ -70,7 +85,8 @@ def universal_dif_diagnosis_parser(diagnosis_text: str | None, regex_number=r'^\
                 current_rank = None # Keep rank as None if parsing fails
 
             current_diagnosis = match.group(2).strip()
-            current_reasoning_lines = []
+            # The previous lines were already joined, so the buffer is reused instead of reallocated
+            current_reasoning_lines.clear()
             initial_reasoning = match.group(3) # May be None if no colon/text after colon
             if initial_reasoning and initial_reasoning.strip():
                 current_reasoning_lines.append(initial_reasoning.strip())
@@ -83,7 +99,7 @@ def universal_dif_diagnosis_parser(diagnosis_text: str | None, regex_number=r'^\
 
     # Add the last processed diagnosis
     if current_diagnosis is not None:
-        reasoning = "\n".join(current_reasoning_lines).strip() if current_reasoning_lines else None
+        reasoning = "\n".join(current_reasoning_lines) if current_reasoning_lines else None
         diagnoses.append((current_rank, current_diagnosis, reasoning))
         logger.debug(f"Saved last diagnosis: Rank={current_rank}, Name={current_diagnosis}")
 
@@ -97,10 +113,10 @@ def universal_dif_diagnosis_parser(diagnosis_text: str | None, regex_number=r'^\
             diagnosis_name = parts[0].strip()
             reasoning = parts[1].strip()
             if len(lines) > 1:
-                 reasoning += "\n" + "\n".join(l.strip() for l in lines[1:] if l.strip())
+                 reasoning += "\n" + "\n".join(lines[1:])
         else:
             diagnosis_name = first_line # Use the whole first line
-            reasoning = "\n".join(l.strip() for l in lines[1:] if l.strip()) if len(lines) > 1 else None
+            reasoning = "\n".join(lines[1:]) if len(lines) > 1 else None
             
         diagnoses.append((1, diagnosis_name, reasoning)) # Default rank 1
 
@@ -123,13 +139,13 @@ def parse_top5_xml(diagnosis_text: str | None) -> str | None:
     if not diagnosis_text:
         return None
         
-    match = re.search(r"<top5>(.*?)</top5>", diagnosis_text, re.DOTALL)
+    match = TOP5_RE.search(diagnosis_text)
     if match:
         return match.group(1).strip()
     else:
         logger.warning("Could not find <top5> tags in the text.")
         # Fallback: maybe the format is slightly different, e.g., <5_diagnosis_output>
-        match = re.search(r"<5_diagnosis_output>(.*?)</5_diagnosis_output>", diagnosis_text, re.DOTALL)
+        match = DIAGNOSIS_OUTPUT_RE.search(diagnosis_text)
         if match:
              logger.info("Found <5_diagnosis_output> tags instead of <top5>.")
              return match.group(1).strip()
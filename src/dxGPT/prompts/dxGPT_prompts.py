@@ -2,44 +2,40 @@
 Prompt builders for the dxGPT diagnosis generation task.
 Follows the lapin PromptBuilder pattern using meta-templates and sections.
 """
-from typing import Dict, Any, Type
+from typing import Dict, Any, Type, Optional
 # Direct import, removing try...except
 from lapin.prompt_builder.base import PromptBuilder
 
-# --- Local Prompt Registry and Decorator ---
+# --- Local Prompt Registry ---
 DXGPT_PROMPT_REGISTRY: Dict[str, Type[PromptBuilder]] = {}
 
-# Modified decorator: Takes no arguments, uses cls.alias()
-def register_prompt(cls: Type[PromptBuilder], verbose: bool = False) -> Type[PromptBuilder]:
-    """Decorator to register a dxGPT prompt class using its alias() method."""
-    try:
-        alias = cls.alias()
-        if not isinstance(alias, str):
-            raise TypeError("alias() must return a string.")
-        if alias in DXGPT_PROMPT_REGISTRY:
-            print(f"[WARN] Overwriting existing prompt alias in registry: {alias}")
-        DXGPT_PROMPT_REGISTRY[alias] = cls
-        if verbose: print(f"[INFO] Registered prompt class '{cls.__name__}' with alias '{alias}'")
-    except AttributeError:
-        print(f"[ERROR] Class {cls.__name__} is missing the required 'alias' classmethod for registration.")
-    except TypeError as e:
-        print(f"[ERROR] Class {cls.__name__} alias() method error: {e}")
-    # Return the original class regardless of registration success/failure
-    # to allow Python to continue parsing the class definition.
-    return cls
-
 # --- Base PromptBuilder ---
 # Inheriting directly from lapin's base.
 # Removed the local dummy PromptBuilder and the to_prompt adapter.
 
-# --- Specific Prompt Builders --- 
+class DxGPTPromptBase(PromptBuilder):
+    """Common base for dxGPT prompts.
+
+    Subclasses declare their alias in the `ALIAS` class attribute and are added
+    to DXGPT_PROMPT_REGISTRY by `__init_subclass__` when the class is defined,
+    with no decorator call or alias() dispatch at import time.
+    """
+    ALIAS: Optional[str] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.ALIAS:
+            DXGPT_PROMPT_REGISTRY[cls.ALIAS] = cls
 
-@register_prompt # Decorator applied without argument
-class StandardDxGPTPrompt(PromptBuilder):
-    """Builds the standard diagnosis prompt."""
     @classmethod
     def alias(cls) -> str:
-        return "dxgpt_standard"
+        return cls.ALIAS
+
+# --- Specific Prompt Builders --- 
+
+class StandardDxGPTPrompt(DxGPTPromptBase):
+    """Builds the standard diagnosis prompt."""
+    ALIAS = "dxgpt_standard"
 
     def __init__(self, verbose: bool = False):
         super().__init__(verbose=verbose)
@@ -54,12 +50,9 @@ Symptoms:{description}
         self.load_section_from_text("intro", intro_text)
         self.build_template() # Build the template after loading static sections
 
-@register_prompt
-class RareDxGPTPrompt(PromptBuilder):
+class RareDxGPTPrompt(DxGPTPromptBase):
     """Builds the rare disease focused diagnosis prompt."""
-    @classmethod
-    def alias(cls) -> str:
-        return "dxgpt_rare"
+    ALIAS = "dxgpt_rare"
 
     def __init__(self, verbose: bool = False):
         super().__init__(verbose=verbose)
@@ -74,12 +67,9 @@ Symptoms:{description}
         self.load_section_from_text("intro", intro_text)
         self.build_template()
 
-@register_prompt
-class ImprovedDxGPTPrompt(PromptBuilder):
+class ImprovedDxGPTPrompt(DxGPTPromptBase):
     """Builds the improved diagnosis prompt with thinking step and XML tags."""
-    @classmethod
-    def alias(cls) -> str:
-        return "dxgpt_improved"
+    ALIAS = "dxgpt_improved"
 
     def __init__(self, verbose: bool = False):
         super().__init__(verbose=verbose)
@@ -119,12 +109,9 @@ Patient Symptoms:
         self.load_section_from_text("prompt_structure", prompt_structure_text)
         self.build_template()
 
-@register_prompt
-class JSONDxGPTPrompt(PromptBuilder):
+class JSONDxGPTPrompt(DxGPTPromptBase):
     """Builds the diagnosis prompt requesting JSON output."""
-    @classmethod
-    def alias(cls) -> str:
-        return "dxgpt_json"
+    ALIAS = "dxgpt_json"
 
     def __init__(self, verbose: bool = False):
         super().__init__(verbose=verbose)
@@ -178,12 +165,9 @@ Present your final output within <5_diagnosis_output> tags as shown in the examp
         self.load_section_from_text("format_instructions", format_instructions_text)
         self.build_template()
 
-@register_prompt
-class JSONRiskDxGPTPrompt(PromptBuilder):
+class JSONRiskDxGPTPrompt(DxGPTPromptBase):
     """Builds the diagnosis prompt requesting JSON output with risk handling."""
-    @classmethod
-    def alias(cls) -> str:
-        return "dxgpt_json_risk"
+    ALIAS = "dxgpt_json_risk"
 
     def __init__(self, verbose: bool = False):
         super().__init__(verbose=verbose)
@@ -247,4 +231,4 @@ If there are no symptoms in the description or it is not related to a patient's
         self.load_section_from_text("risk_handling", risk_handling_text)
         self.build_template()
 
-# Removed PROMPT_ALIAS_MAP as registration handles alias mapping now.
+# Removed PROMPT_ALIAS_MAP as DxGPTPromptBase.__init_subclass__ handles alias mapping now.
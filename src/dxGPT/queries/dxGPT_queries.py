@@ -2,35 +2,136 @@
 Module for dxGPT specific database query functions.
 """
 
+import datetime
 import logging
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 
+from sqlalchemy import select, insert, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-# Import the underlying add functions from the centralized location
-from db.queries.post.post_bench29 import (
-    add_llm_differential_diagnosis,
-    add_differential_diagnosis_to_rank
-)
+from db.bench29.bench29_models import CasesBench, LlmDifferentialDiagnosis, DifferentialDiagnosis2Rank
+from dxGPT.utils.text_conversion import AggregatedResult
 
 logger = logging.getLogger(__name__)
 
+# Column limits read from the schema once at import (None for unbounded Text columns)
+_RANKS_TABLE = DifferentialDiagnosis2Rank.__table__
+PREDICTED_DIAGNOSIS_MAX_LENGTH = _RANKS_TABLE.c.predicted_diagnosis.type.length
+REASONING_MAX_LENGTH = getattr(_RANKS_TABLE.c.reasoning.type, "length", None)
+
+
+def fit_to_column(value: Any, max_length: Optional[int]) -> str:
+    """Converts a value to str and truncates it to a column length.
+
+    Strings are neither copied by str() nor sliced when they already fit.
+    """
+    if not isinstance(value, str):
+        value = str(value)
+    if max_length is not None and len(value) > max_length:
+        value = value[:max_length]
+    return value
+
+
+def fetch_cases_from_db(
+    session,
+    hospital: Optional[str] = None,
+    num_samples: Optional[int] = None,
+    yield_per: int = 100
+) -> Iterator[Any]:
+    """Streams the cases to be diagnosed, optionally filtered and limited.
+
+    Only the columns needed to build prompts (`id`, `original_text`) are
+    selected, and plain result rows are returned instead of CasesBench
+    instances, so no ORM instrumentation or identity-map bookkeeping happens
+    per case. The column attributes are resolved once, when the lambda
+    statement is first compiled.
+
+    The statement is assembled with lambda_stmt: each combination of filters
+    (hospital present or not, limit present or not) is compiled once and cached,
+    later calls only re-bind the parameter values.
+
+    Rows are streamed through a server-side cursor in chunks of `yield_per`
+    instead of being materialized with .all(), so the caller can start
+    wrapping cases as soon as the first chunk arrives. The session must stay
+    open until the iterator is exhausted.
+
+    Args:
+        session: SQLAlchemy database session.
+        hospital: Hospital/dataset name to filter by. None or 'all' disables the filter.
+        num_samples: Maximum number of cases to return. None returns all matches.
+        yield_per: Number of rows fetched from the cursor per round trip.
+
+    Returns:
+        Iterator of rows with `id` and `original_text` attributes, ordered by id.
+    """
+    stmt = lambda_stmt(lambda: select(CasesBench.id, CasesBench.original_text).order_by(CasesBench.id))
+    if hospital is not None and hospital != "all":
+        stmt += lambda s: s.where(CasesBench.hospital == hospital)
+    if num_samples is not None:
+        stmt += lambda s: s.limit(num_samples)
+    result = session.execute(
+        stmt,
+        execution_options={"stream_results": True, "yield_per": yield_per}
+    )
+    return result
+
+
+def insert_differential_diagnoses_ignore_existing(session, rows: List[Dict[str, Any]]) -> Dict[Tuple[int, int, int], int]:
+    """Inserts LlmDifferentialDiagnosis rows in one statement, skipping existing ones.
+
+    Deduplication is pushed into the database (`ON CONFLICT DO NOTHING` on
+    PostgreSQL, `INSERT OR IGNORE` on SQLite) against the unique
+    (cases_bench_id, model_id, prompt_id) key, so no existence SELECT is needed
+    and there is no race window between check and insert. Does not commit.
+
+    Args:
+        session: SQLAlchemy database session.
+        rows: List of column dicts for LlmDifferentialDiagnosis.
+
+    Returns:
+        Dict mapping (cases_bench_id, model_id, prompt_id) to the new row id.
+        Triples that already existed are absent from the dict.
+    """
+    if not rows:
+        return {}
+    if session.get_bind().dialect.name == "postgresql":
+        stmt = pg_insert(LlmDifferentialDiagnosis).values(rows).on_conflict_do_nothing(
+            index_elements=["cases_bench_id", "model_id", "prompt_id"]
+        )
+    else:
+        stmt = insert(LlmDifferentialDiagnosis).values(rows).prefix_with("OR IGNORE")
+    stmt = stmt.returning(
+        LlmDifferentialDiagnosis.id,
+        LlmDifferentialDiagnosis.cases_bench_id,
+        LlmDifferentialDiagnosis.model_id,
+        LlmDifferentialDiagnosis.prompt_id
+    )
+    return {
+        (row.cases_bench_id, row.model_id, row.prompt_id): row.id
+        for row in session.execute(stmt)
+    }
+
 
 def add_batch_differential_diagnoses(
     session,
-    aggregated_results: List[Dict[str, Any]],
+    aggregated_results: List[AggregatedResult],
     verbose: bool = False
 ):
     """Processes a batch of aggregated diagnosis results and adds them to the DB.
 
-    This function iterates through the aggregated results and calls the existing
-    auto-committing functions `add_llm_differential_diagnosis` and
-    `add_differential_diagnosis_to_rank` for each item and its ranks.
+    All parent LlmDifferentialDiagnosis rows are inserted in a single
+    `insert_differential_diagnoses_ignore_existing` statement; items whose
+    (case, model, prompt) triple already existed come back without an id and
+    are skipped. The ranks of the new parents are collected and inserted with a
+    single executemany. Parents and ranks are written in one transaction on the
+    caller's session and committed once at the end of the batch (rolled back
+    on error), instead of one commit per row.
 
     Args:
         session: SQLAlchemy database session.
-        aggregated_results: A list of dictionaries, where each dictionary
-            contains keys like 'case_id', 'model_id', 'prompt_alias',
-            'raw_response', and 'parsed_diagnoses' (a list of tuples).
+        aggregated_results: AggregatedResult items from process_results, each
+            holding the case/model/prompt ids, the differential diagnosis
+            text and its parsed (rank, name, reasoning) tuples.
         verbose: Enable detailed logging.
     """
     total_items = len(aggregated_results)
@@ -43,78 +144,84 @@ def add_batch_differential_diagnoses(
     if verbose:
         print(f"\nStarting batch database insertion for {total_items} processed items...")
 
-    for idx, item_data in enumerate(aggregated_results):
-        case_bench_id = item_data.get("case_id")
-        model_id = item_data.get("model_id")
-        prompt_id = item_data.get("prompt_id")
-        differential_diagnoses = item_data.get("differential_diagnoses")
-        differential_diagnoses_ranks = item_data.get("differential_diagnoses_ranks")
-
-
-
+    # --- 1. Add Parent LlmDifferentialDiagnosis Records in one statement ---
+    timestamp = datetime.datetime.utcnow()
+    inserted_ids = insert_differential_diagnoses_ignore_existing(session, [
+        {
+            "cases_bench_id": item.case_id,
+            "model_id": item.model_id,
+            "prompt_id": item.prompt_id,
+            "diagnosis": item.differential_diagnoses,
+            "timestamp": timestamp,
+        }
+        for item in aggregated_results
+    ])
+    rank_rows = []
 
+    for idx, item_data in enumerate(aggregated_results):
+        case_bench_id = item_data.case_id
+        model_id = item_data.model_id
+        prompt_id = item_data.prompt_id
+        differential_diagnoses_ranks = item_data.differential_diagnoses_ranks
 
         if verbose:
             print(f"  Processing item {idx+1}/{total_items} (Case={case_bench_id}, Model={model_id}, Prompt={prompt_id})...")
 
-        # --- 1. Add Parent LlmDifferentialDiagnosis Record --- 
-        # This function handles its own commit and existence check.
-        llm_diag_id = add_llm_differential_diagnosis(
-            session,
-            case_bench_id,
-            model_id,
-            prompt_id,
-            differential_diagnoses,
-            check_exists=True,
-            verbose=False # Keep underlying function quieter unless debugging batch function
-        )
-        print("LLM DIAG ID")
-        print(llm_diag_id)
-        if llm_diag_id is False or llm_diag_id is None:
-            raise ValueError(f"    Skipping ranks for Case ID: {case_id}, Model ID: {model_id} as parent insertion failed or already exists.")
- 
+        llm_diag_id = inserted_ids.get((case_bench_id, model_id, prompt_id))
+        if llm_diag_id is None:
+            if verbose:
+                print(f"    LlmDifferentialDiagnosis already exists for Case={case_bench_id}, Model={model_id}, Prompt={prompt_id}, skipping")
+            parent_records_failed_or_skipped += 1
+            continue
+
+        parent_records_added += 1
+
         # --- 2. Add Child DifferentialDiagnosis2Rank Records --- 
         ranks_added_for_this_item = 0
+        differential_diagnoses_ranks = differential_diagnoses_ranks or []
         for rank_tuple in differential_diagnoses_ranks:
             total_ranks_processed += 1
  
             # Ensure tuple has the correct structure (rank, name, reason)
+            if len(rank_tuple) != 3:
+                if verbose:
+                    print(f"    [WARN] Skipping malformed rank {rank_tuple!r} for Case={case_bench_id}.")
+                total_ranks_failed_or_skipped += 1
+                continue
             rank, predicted_diagnosis, reasoning = rank_tuple
 
 
-            # This function handles its own commit and existence check.
-            rank_id = add_differential_diagnosis_to_rank(
-                session=session,
-                cases_bench_id=case_bench_id, # Pass case_id if needed by function
-                differential_diagnosis_id=llm_diag_id, # Link to parent ID
-                rank_position=rank,
-                predicted_diagnosis=str(predicted_diagnosis)[:250], # Limit length
-                reasoning=str(reasoning)[:250] if reasoning else None, # Handle None and limit
-                check_exists=True,
-                verbose=False # Keep underlying function quieter
-            )
-
-            if rank_id is False or rank_id is None:
-                 if verbose: print(f"    [WARN] Failed to add/skipped rank {db_rank_position} ('{predicted_diagnosis}') for Parent {llm_diag_id}.")
-                 total_ranks_failed_or_skipped += 1
-            else:
-                 total_ranks_added += 1
-                 ranks_added_for_this_item += 1
+            # The parent is new, so its ranks cannot exist yet; queue them for one bulk insert.
+            rank_rows.append({
+                "cases_bench_id": case_bench_id,
+                "differential_diagnosis_id": llm_diag_id, # Link to parent ID
+                "rank_position": rank,
+                "predicted_diagnosis": fit_to_column(predicted_diagnosis, PREDICTED_DIAGNOSIS_MAX_LENGTH),
+                "reasoning": fit_to_column(reasoning, REASONING_MAX_LENGTH) if reasoning else None, # Handle None
+            })
+            ranks_added_for_this_item += 1
         
         if verbose:
             if ranks_added_for_this_item > 0:
                 print(f"    Successfully added {ranks_added_for_this_item} ranks for Parent {llm_diag_id}.")
         if ranks_added_for_this_item == 0:
-            print(f"    [WARN] No ranks were successfully added for Parent {llm_diag_id} (out of {len(parsed_diagnoses)} parsed). Parent record was still added/found.")
+            logger.warning("No ranks were successfully added for Parent %s (out of %s parsed). Parent record was still added/found.", llm_diag_id, len(differential_diagnoses_ranks))
              # Note: Parent is still counted in parent_records_added
-    
+
+    # --- 3. Insert all ranks and commit the whole batch once ---
+    try:
+        if rank_rows:
+            session.execute(insert(DifferentialDiagnosis2Rank), rank_rows)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    total_ranks_added = len(rank_rows)
 
     # --- Final Summary for Batch Insert ---
-    print("\n--- Batch DB Insertion Summary ---")
-    print(f"Total items received: {total_items}")
-    print(f"Parent Records Added/Found: {parent_records_added}")
-    print(f"Parent Records Failed/Skipped: {parent_records_failed_or_skipped}")
-    print(f"Total Ranks Processed: {total_ranks_processed}")
-    print(f"Total Ranks Added/Found: {total_ranks_added}")
-    print(f"Total Ranks Failed/Skipped: {total_ranks_failed_or_skipped}")
-    print("----------------------------------") 
\ No newline at end of file
+    logger.info(
+        "Batch DB insertion summary: items received=%s, parents added=%s, parents failed/skipped=%s, "
+        "ranks processed=%s, ranks added=%s, ranks failed/skipped=%s",
+        total_items, parent_records_added, parent_records_failed_or_skipped,
+        total_ranks_processed, total_ranks_added, total_ranks_failed_or_skipped
+    ) 
\ No newline at end of file
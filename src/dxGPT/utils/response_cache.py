@@ -0,0 +1,115 @@
+"""
+Exact-match cache of raw LLM responses for dxGPT runs.
+
+Responses are keyed on a hash of (model alias, prompt alias, prompt template
+text, generation parameters, case description) and kept both in memory and in
+a local SQLite file, so re-running the same case set with the same model,
+prompt and sampling settings does not call the LLM again. Editing a template
+or a sampling parameter changes the key, so old responses are not replayed.
+The cache is opt-in (--use_cache): benchmark runs call the LLM by default.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "dxgpt", "responses.sqlite")
+
+
+class ResponseCache:
+    """Two-level (dict + SQLite) exact-match cache of raw LLM responses."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, verbose: bool = False):
+        """
+        Args:
+            path: SQLite file backing the cache. Its directory is created if missing.
+            verbose: Enable verbose output.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.verbose = verbose
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+        self.conn.commit()
+        self.memory: Dict[str, str] = {}
+
+    @staticmethod
+    def make_context(prompt_template: Any, generation_params: Optional[Dict[str, Any]] = None) -> str:
+        """Serializes what shapes a response besides the case: template text and generation params.
+
+        Parameters whose name mentions a key, secret or password are left out, so
+        rotating credentials does not invalidate the cache (and they are never hashed).
+        """
+        params = {
+            name: value
+            for name, value in (generation_params or {}).items()
+            if not any(word in name.lower() for word in ("key", "secret", "password"))
+        }
+        return json.dumps({"template": str(prompt_template), "params": params}, sort_keys=True, default=str)
+
+    @staticmethod
+    def make_key(model_alias: str, prompt_alias: str, description: str, context: str = "") -> str:
+        """Hashes the inputs that fully determine the request sent to the model.
+
+        `context` is the make_context string of the prompt template and generation params.
+        """
+        raw = f"{model_alias}|{prompt_alias}|{context}|{description}".encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for a key, or None on a miss."""
+        response = self.memory.get(key)
+        if response is None:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                response = row[0]
+                self.memory[key] = response
+        return response
+
+    def set_many(self, items: Dict[str, str]):
+        """Stores several key -> response pairs in a single transaction."""
+        if not items:
+            return
+        self.memory.update(items)
+        self.conn.executemany("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", items.items())
+        self.conn.commit()
+
+    def split(self, input_wrappers: List[Any], model_alias: str, prompt_alias: str, context: str = "") -> Tuple[List[Dict[str, Any]], List[Any]]:
+        """Separates wrappers with a cached response from those that need an LLM call.
+
+        Args:
+            input_wrappers: DxGPTInputWrapper objects (`id` and `text` attributes).
+            model_alias: Alias of the target LLM.
+            prompt_alias: Alias of the prompt builder.
+            context: make_context string of the prompt template and generation params.
+
+        Returns:
+            tuple:
+                - Result dicts for cache hits, shaped like process_all_batches results.
+                - Wrappers that were not found in the cache.
+        """
+        cached_results = []
+        pending_wrappers = []
+        for wrapper in input_wrappers:
+            response = self.get(self.make_key(model_alias, prompt_alias, wrapper.text, context))
+            if response is None:
+                pending_wrappers.append(wrapper)
+            else:
+                cached_results.append({"id": wrapper.id, "success": True, "text": response, "cached": True})
+        if self.verbose:
+            print(f"Response cache: {len(cached_results)} hits, {len(pending_wrappers)} misses.")
+        return cached_results, pending_wrappers
+
+    def store(self, results: List[Dict[str, Any]], input_wrappers: List[Any], model_alias: str, prompt_alias: str, context: str = ""):
+        """Caches the text of every successful result from process_all_batches."""
+        id_to_text = {wrapper.id: wrapper.text for wrapper in input_wrappers}
+        self.set_many({
+            self.make_key(model_alias, prompt_alias, id_to_text[result["id"]], context): result["text"]
+            for result in results
+            if result.get("success") and result.get("text") is not None and result.get("id") in id_to_text
+        })
+
+    def close(self):
+        self.conn.close()
@@ -1,8 +1,10 @@
-from typing import List, Dict, Optional, NamedTuple, Any
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Any, Tuple
 
 # --- Helper Data Structures (Moved from dxGPT_async.py) ---
-class DxGPTInputWrapper(NamedTuple):
-    """Simple wrapper to hold data for process_all_batches."""
+@dataclass(slots=True, frozen=True)
+class DxGPTInputWrapper:
+    """Simple wrapper to hold data for process_all_batches (slot attributes, cheaper than a NamedTuple)."""
     id: str # Unique identifier for the item (e.g., case_id)
     text: str # The prompt text to send to the LLM
     # Add any other metadata needed in process_results, accessible via result[\'original_item\']
@@ -11,34 +13,30 @@ class DxGPTInputWrapper(NamedTuple):
     prompt_id: int
 
 
+@dataclass(slots=True)
+class AggregatedResult:
+    """Parsed LLM output for one case, ready for add_batch_differential_diagnoses."""
+    case_id: int
+    model_id: int
+    prompt_id: int
+    differential_diagnoses: str # Raw differential diagnosis text block
+    differential_diagnoses_ranks: List[Tuple[Any, str, Optional[str]]] # (rank, name, reasoning)
+
 
 def wrap_prompts(cases: List[Any], model_id: int, prompt_id: int) -> List[DxGPTInputWrapper]:
     """Wraps case data into DxGPTInputWrapper objects for batch processing.
 
     Args:
-        cases: List of case objects (expected to have 'id' and 'original_text' attributes).
+        cases: Iterable of case objects or rows (expected to have 'id' and 'original_text' attributes).
         model_id: The ID of the model being used.
         prompt_id: The ID of the prompt being used.
 
     Returns:
         List of DxGPTInputWrapper objects.
     """
-    input_wrappers = []
-    for case in cases:
-        # Prepare the input data for the prompt builder
-        # Store the primary input (case description) in the .text field
-        # If builder needs more, lapin might need modification or wrapper needs more fields
-        input_text_for_builder = case.original_text
-        # We could pass additional info via the wrapper if needed, but process_all_batches
-        # currently only uses the item specified by `text_attr`.
-
-        wrapper = DxGPTInputWrapper(
-             id=f"case_{case.id}", # Unique ID for the item
-             text=input_text_for_builder, # Store INPUT text
-             case_id=case.id,
-             model_id=model_id,
-             prompt_id = prompt_id # Store prompt id used
-         )
-        input_wrappers.append(wrapper)
-        # Errors during prompt building will now propagate upwards
-    return input_wrappers
\ No newline at end of file
+    # The primary input (case description) goes in .text; prompt building happens later in lapin.
+    # Fields are passed positionally (id, text, case_id, model_id, prompt_id) to keep the per-case cost low.
+    return [
+        DxGPTInputWrapper("case_" + str(case.id), case.original_text, case.id, model_id, prompt_id)
+        for case in cases
+    ]
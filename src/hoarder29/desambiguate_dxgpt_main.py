@@ -2,47 +2,131 @@ import __init__
 import pandas as pd
 import os
 from src.dxGPT.parsers.dxGPT_parsers import universal_dif_diagnosis_parser
-from src.db.queries.get.get_bench29 import get_cases_bench
 from src.db.utils.db_utils import get_session
 from hoarder29.utils.utils import extract_model_from_filename
-from hoarder29.queries.hoarder29_queries import insert_or_fetch_model, insert_or_fetch_prompt, add_llm_diagnosis_to_db, add_diagnosis_rank_to_db
-import glob
+from db.bench29.bench29_models import DifferentialDiagnosis2Rank
+from hoarder29.queries.hoarder29_queries import insert_or_fetch_model, insert_or_fetch_prompt, get_case_ids_by_source_file_path, add_llm_diagnoses_batch
+import fnmatch
 import datetime
+import atexit
+import functools
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy.orm import sessionmaker
 
 # --- Log File Setup ---
 LOG_FILE_NAME = "processing_log.txt"
-# Ensure the log file is writable, create if doesn't exist
+# The log file is opened once with a 64 KiB buffer and flushed after each file,
+# instead of being reopened for every logged line
 try:
-    with open(LOG_FILE_NAME, 'a', encoding='utf-8') as f:
-        f.write(f"\n--- New Run Started: {datetime.datetime.now()} ---\n")
+    _LOG_FH = open(LOG_FILE_NAME, 'a', encoding='utf-8', buffering=1 << 16)
+    atexit.register(_LOG_FH.close)
+    _LOG_FH.write(f"\n--- New Run Started: {datetime.datetime.now()} ---\n")
 except IOError as e:
+    _LOG_FH = None
     print(f"Error: Could not open or write to log file '{LOG_FILE_NAME}': {e}")
     # Decide if you want to exit or continue without file logging
     # exit(1) # Uncomment to exit if logging fails
 
-def log_message(message):
-    """Helper function to print and log a message."""
-    print(message)
-    try:
-        with open(LOG_FILE_NAME, 'a', encoding='utf-8') as f:
-            f.write(message + '\n')
-    except IOError as e:
-        # Print error related to logging but continue execution
-        print(f"  (Error writing to log file: {e})")
+# Echo log lines to stdout; per-row messages are never echoed (they only go to the log file)
+LOG_TO_STDOUT = True
+# Files are processed by worker threads; keep each logged line in one piece
+_LOG_LOCK = threading.Lock()
+
+def log_message(message, to_stdout=True):
+    """
+    Helper function to log a message, and print it if LOG_TO_STDOUT and to_stdout are set.
+    High-volume (per-row) messages pass to_stdout=False to save a terminal write per line.
+    """
+    with _LOG_LOCK:
+        if LOG_TO_STDOUT and to_stdout:
+            print(message)
+        if _LOG_FH is None:
+            return
+        try:
+            _LOG_FH.write(message)
+            _LOG_FH.write('\n')
+        except IOError as e:
+            # Print error related to logging but continue execution
+            print(f"  (Error writing to log file: {e})")
+
+def flush_log():
+    """Flush buffered log lines to the log file."""
+    if _LOG_FH is None:
+        return
+    with _LOG_LOCK:
+        try:
+            _LOG_FH.flush()
+        except IOError as e:
+            print(f"  (Error writing to log file: {e})")
 
 # --- End Log File Setup ---
 
+# Number of CSV rows read, parsed and flushed to the database at a time
+BATCH_SIZE = 1000
+# The only CSV columns process_file reads, in order of preference
+DIAGNOSIS_COLUMNS = ('Diagnosis 1', 'Diagnosis')
+# Length of DifferentialDiagnosis2Rank.predicted_diagnosis (VARCHAR counts characters in PostgreSQL)
+PREDICTED_DIAGNOSIS_MAX_LENGTH = DifferentialDiagnosis2Rank.__table__.c.predicted_diagnosis.type.length
+# Number of CSV files processed concurrently (each file gets its own short-lived session)
+MAX_WORKERS = 8
+# Two files of the same model must not both try to create it
+_MODEL_LOCK = threading.Lock()
+
 
 def get_files( pattern, dir_, verbose = True):
-    pattern = os.path.join(dir_, pattern)
-    files = [os.path.basename(f) for f in glob.glob(pattern) if os.path.isfile(f)]
+    # A single directory scan; DirEntry.is_file() reuses the type from the listing instead of a stat per match
+    with os.scandir(dir_) as entries:
+        files = [entry.name for entry in entries if fnmatch.fnmatch(entry.name, pattern) and entry.is_file()]
     if verbose:
         # Use log_message for initial file listing if desired
-        log_message(f"Files in {dir_} matching '{os.path.basename(pattern)}':")
+        log_message(f"Files in {dir_} matching '{pattern}':")
         for f in files:
              log_message(f"  - {f}") # Log each file found
     return files
 
+@functools.lru_cache(maxsize=None)
+def compile_substring_pattern(substrings):
+    """
+    Compile a tuple of literal substrings into one alternation regex (None if empty).
+    Cached, so each datasets/exclude tuple is compiled only once per run.
+    Alternatives are tried longest first, so when one key contains another
+    (e.g. '_Dic_' and '_Dic_1000_') the longer, more specific key wins
+    regardless of dict order.
+    """
+    if not substrings:
+        return None
+    ordered = sorted(substrings, key=len, reverse=True)
+    return re.compile('(' + '|'.join(re.escape(substring) for substring in ordered) + ')')
+
+def select_diagnosis_column(df):
+    """
+    Resolve the LLM diagnosis of every row of a chunk in one column operation.
+    Uses the first of DIAGNOSIS_COLUMNS present in the chunk, filling its empty cells
+    from the following ones. The columns are read as str, and missing cells become '',
+    so every value is a plain string; a chunk without any of them yields all ''.
+    """
+    columns = [column for column in DIAGNOSIS_COLUMNS if column in df.columns]
+    if not columns:
+        return pd.Series('', index=df.index, dtype=object)
+    diagnoses = df[columns[0]].fillna('')
+    for column in columns[1:]:
+        diagnoses = diagnoses.where(diagnoses != '', df[column].fillna(''))
+    return diagnoses
+
+def is_valid_rank(pred_disease):
+    """A parsed rank is usable when it is a (rank_position, diagnosis_name, reasoning) triple."""
+    return bool(pred_disease) and len(pred_disease) == 3
+
+@functools.lru_cache(maxsize=65536)
+def parse_differential_diagnosis(llm_differential_diagnosis):
+    """
+    Memoized universal_dif_diagnosis_parser: identical diagnosis texts are parsed once per run.
+    Returns a tuple so the cached result cannot be mutated by a caller.
+    """
+    return tuple(universal_dif_diagnosis_parser(llm_differential_diagnosis))
+
 def process_file(file, datasets, session, prompt_id, input_dir_base, exclude, verbose=True):
     """
     Processes a single diagnosis file, adding entries to the database.
@@ -51,7 +135,6 @@ def process_file(file, datasets, session, prompt_id, input_dir_base, exclude, ve
     """
     count_llm_diagnosis_file = 0
     count_diagnosis_rank_file = 0
-    model_processed = False
     model_id = None
     processed_model_name = None
     processed_db_dataset_name = None
@@ -60,116 +143,162 @@ def process_file(file, datasets, session, prompt_id, input_dir_base, exclude, ve
     if verbose:
         log_message(f"Processing file: {file}")
 
-    for dataset_key, db_dataset_name in datasets.items():
-        if dataset_key in file:
-            # if "PUMCH" in dataset_key or "RAME" in dataset_key:
-            #      if verbose:
-            #         log_message(f"  File '{file}': Skipping dataset key '{dataset_key}' based on exclusion criteria.")
-            #      continue
-
-            current_model_name = extract_model_from_filename(file, dataset=dataset_key, verbose=False) # Keep internal verbose off
-
-            if any(ex in current_model_name for ex in exclude):
-                 if verbose:
-                    log_message(f"  File '{file}': Skipping model '{current_model_name}' due to exclude list.")
-                 continue
-
-            processed_model_name = current_model_name
-            processed_db_dataset_name = db_dataset_name
-
-            if not model_processed:
-                # Pass verbose=False to DB functions if you don't want their internal prints
-                # But rely on our log_message calls for control
-                model_id = insert_or_fetch_model(session, processed_model_name, verbose=False)
-                if not model_id:
-                    # Use log_message for errors too
-                    log_message(f"  File '{file}': Error: Could not insert or fetch model ID for '{processed_model_name}'. Skipping file processing.")
-                    return 0, 0, None, None
-                model_processed = True
-                if verbose:
-                    log_message(f"  File '{file}': Using Model: '{processed_model_name}' (ID: {model_id}) for dataset '{processed_db_dataset_name}'")
-
-
-            file_path = os.path.join(input_dir_base, file)
-            try:
-                df = pd.read_csv(file_path)
-            except FileNotFoundError:
-                 log_message(f"  File '{file}': Error reading file at '{file_path}'. Skipping.")
-                 continue # Skip to next dataset key or file if reading fails
-
-
-            for index, row in df.iterrows():
-                llm_differential_diagnosis = row.get('Diagnosis 1') or row.get('Diagnosis')
-                golden_diagnosis = row.get('GT')
-                case_id = None
-
-                if not llm_differential_diagnosis or "ERROR" in str(llm_differential_diagnosis):
-                    if verbose:
-                        status = "is missing" if not llm_differential_diagnosis else "contains ERROR"
-                        log_message(f"    File '{file}', Model '{processed_model_name}', Dataset '{processed_db_dataset_name}', Row {index}: Skipping row - LLM diagnosis {status}.")
-                    continue
+    # One regex scan per file finds the dataset key (datasets and exclude are compiled once, see compile_substring_pattern)
+    dataset_pattern = compile_substring_pattern(tuple(datasets))
+    dataset_match = dataset_pattern.search(file) if dataset_pattern is not None else None
+    if not dataset_match:
+        if verbose:
+            log_message(f"  File '{file}': Skipping - No matching dataset key found.")
+        return 0, 0, None, None
+    dataset_key = dataset_match.group(1)
+    db_dataset_name = datasets[dataset_key]
+
+    # The model name is what follows the dataset key, so excluded files are dropped before parsing it
+    exclude_pattern = compile_substring_pattern(tuple(exclude))
+    model_part = os.path.splitext(file)[0][dataset_match.end():]
+    if exclude_pattern is not None and exclude_pattern.search(model_part):
+        if verbose:
+            log_message(f"  File '{file}': Skipping model '{model_part}' due to exclude list.")
+        return 0, 0, None, None
+
+    current_model_name = extract_model_from_filename(file, dataset=dataset_key, verbose=False) # Keep internal verbose off
+    if not current_model_name:
+        if verbose:
+            log_message(f"  File '{file}': Skipping - Could not extract a model name.")
+        return 0, 0, None, None
+
+    processed_model_name = current_model_name
+    processed_db_dataset_name = db_dataset_name
+
+    # Pass verbose=False to DB functions if you don't want their internal prints
+    # But rely on our log_message calls for control
+    with _MODEL_LOCK:
+        model_id = insert_or_fetch_model(session, processed_model_name, verbose=False)
+    if not model_id:
+        # Use log_message for errors too
+        log_message(f"  File '{file}': Error: Could not insert or fetch model ID for '{processed_model_name}'. Skipping file processing.")
+        return 0, 0, None, None
+    if verbose:
+        log_message(f"  File '{file}': Using Model: '{processed_model_name}' (ID: {model_id}) for dataset '{processed_db_dataset_name}'")
 
-                db_index = str(index)
-                try:
-                    case = get_cases_bench(session, hospital=processed_db_dataset_name, source_file_path=db_index)
-                except Exception as e:
-                    log_message(f"    File '{file}', Model '{processed_model_name}', Dataset '{processed_db_dataset_name}': Error fetching case for hospital='{processed_db_dataset_name}', source_file_path='{db_index}': {e}. Skipping row.")
-                    continue # Skip this row if case fetching fails
 
-                if not case:
+    file_path = os.path.join(input_dir_base, file)
+    try:
+        # Streamed in BATCH_SIZE-row chunks; the index keeps counting across chunks, so it is still the CSV row number
+        reader = pd.read_csv(file_path, chunksize=BATCH_SIZE, usecols=lambda column: column in DIAGNOSIS_COLUMNS, dtype=str)
+    except FileNotFoundError:
+         log_message(f"  File '{file}': Error reading file at '{file_path}'. Skipping.")
+         return 0, 0, None, None
+
+    # The whole file is written in one transaction: each chunk is flushed when it has been parsed
+    # and everything is committed once at the end, or rolled back together if anything fails
+    try:
+        for df in reader:
+            # Cases are keyed by the CSV row index (stored as source_file_path); fetch the chunk's cases at once
+            case_map = get_case_ids_by_source_file_path(session, processed_db_dataset_name, [str(index) for index in df.index])
+
+            pending_diagnoses = []
+            diagnoses = select_diagnosis_column(df)
+            # Missing and ERROR answers are filtered with column masks; only the kept rows enter the Python loop
+            missing = diagnoses == ''
+            has_error = diagnoses.str.contains('ERROR', regex=False)
+            if verbose:
+                for status, skipped in (("is missing", missing), ("contains ERROR", has_error)):
+                    for index in diagnoses.index[skipped]:
+                        log_message(f"    File '{file}', Model '{processed_model_name}', Dataset '{processed_db_dataset_name}', Row {index}: Skipping row - LLM diagnosis {status}.", to_stdout=False)
+
+            for index, llm_differential_diagnosis in diagnoses[~(missing | has_error)].items():
+                db_index = str(index)
+                case_id = case_map.get(db_index)
+                if case_id is None:
                     if verbose:
-                        log_message(f"    File '{file}', Model '{processed_model_name}', Dataset '{processed_db_dataset_name}': Warning: No case found for hospital='{processed_db_dataset_name}', source_file_path='{db_index}'. Skipping row.")
+                        log_message(f"    File '{file}', Model '{processed_model_name}', Dataset '{processed_db_dataset_name}': Warning: No case found for hospital='{processed_db_dataset_name}', source_file_path='{db_index}'. Skipping row.", to_stdout=False)
                     continue
-                case_id = case[0].id
-
 
-                # Pass verbose=False to DB functions if relying on log_message here
-                llm_diagnosis_id = add_llm_diagnosis_to_db(session, case_id, model_id, prompt_id, llm_differential_diagnosis, verbose=False)
-
-                if llm_diagnosis_id:
-                    # Log successful diagnosis addition (optional)
-                    # if verbose: log_message(f"      Diagnosis processed for Case {case_id}, Row {index}")
-                    count_llm_diagnosis_file += 1
-                else:
+                ranks = []
+                pending_diagnoses.append({
+                    'cases_bench_id': case_id,
+                    'model_id': model_id,
+                    'prompt_id': prompt_id,
+                    'diagnosis': llm_differential_diagnosis,
+                    'ranks': ranks
+                })
+                count_llm_diagnosis_file += 1
+
+                parsing = parse_differential_diagnosis(llm_differential_diagnosis)
+                if not parsing:
                     if verbose:
-                         log_message(f"    File '{file}', Model '{processed_model_name}', Case {case_id}: Skipping rank processing for row {index} as LLM diagnosis ID was not obtained or already existed.")
-                    continue # Skip rank processing
+                         log_message(f"    File '{file}', Model '{processed_model_name}', Case {case_id}, Row {index}: Warning: Could not parse differential diagnosis: '{llm_differential_diagnosis[:50]}...'", to_stdout=False)
+                else:
+                    # Names are truncated to the column length in one pass over the parsed tuples
+                    ranks.extend(
+                        (rank_position, diagnosis_name[:PREDICTED_DIAGNOSIS_MAX_LENGTH], reasoning)
+                        for rank_position, diagnosis_name, reasoning in filter(is_valid_rank, parsing)
+                    )
+                    count_diagnosis_rank_file += len(ranks)
+                    if verbose and len(ranks) != len(parsing):
+                        for pred_disease in parsing:
+                            if not is_valid_rank(pred_disease):
+                                log_message(f"    File '{file}', Model '{processed_model_name}', Case {case_id}, Row {index}: Warning: Invalid parsed disease data: {pred_disease}. Skipping rank.", to_stdout=False)
+
+            add_llm_diagnoses_batch(session, pending_diagnoses, commit=False, verbose=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        log_message(f"  File '{file}', Model '{processed_model_name}', Dataset '{processed_db_dataset_name}': Error processing file: {e}. File rolled back.")
+        return 0, 0, None, None
 
 
-                parsing = universal_dif_diagnosis_parser(llm_differential_diagnosis)
-                if not parsing:
-                    if verbose:
-                         log_message(f"    File '{file}', Model '{processed_model_name}', Case {case_id}, Row {index}: Warning: Could not parse differential diagnosis: '{llm_differential_diagnosis[:50]}...'")
-                    continue
+    return count_llm_diagnosis_file, count_diagnosis_rank_file, processed_model_name, processed_db_dataset_name
 
 
-                for pred_disease in parsing:
-                    if not pred_disease or len(pred_disease) != 3:
-                         if verbose:
-                             log_message(f"    File '{file}', Model '{processed_model_name}', Case {case_id}, Row {index}: Warning: Invalid parsed disease data: {pred_disease}. Skipping rank.")
-                         continue
-
-                    rank_position, diagnosis_name, reasoning = pred_disease
-                    # Pass verbose=False to DB function if relying on log_message
-                    added = add_diagnosis_rank_to_db(session, case_id, llm_diagnosis_id, rank_position, diagnosis_name[:255], reasoning, verbose=False)
-                    # if added:
-                        # Log successful rank addition (optional)
-                        # if verbose: log_message(f"      Rank {rank_position} added for Case {case_id}, Row {index}")
-                    count_diagnosis_rank_file += 1
-
-            break # Found and processed matching dataset key
-    else:
-         if verbose and not model_processed:
-            log_message(f"  File '{file}': Skipping - No matching dataset key found or all matches excluded.")
-         return 0, 0, None, None
+def process_file_worker(Session, file, datasets, prompt_id, input_dir_base, exclude, verbose=True):
+    """
+    Runs process_file for one file on a short-lived session of its own.
+    The session's identity map lives only as long as the file, and its
+    connection goes back to the engine's pool when the file is done.
+    """
+    with Session() as session:
+        return process_file(file, datasets, session, prompt_id, input_dir_base, exclude, verbose=verbose)
 
 
-    return count_llm_diagnosis_file, count_diagnosis_rank_file, processed_model_name, processed_db_dataset_name
+def file_group_key(file, datasets):
+    """
+    The (hospital, model) pair a file writes diagnoses for, or the file name itself
+    when it has no dataset key or model name (process_file skips those anyway).
+    Several dataset keys can map to the same hospital (e.g. '_URG_Torre_Dic_200_'
+    and '_URG_Torre_Dic_1000_'), and their row indices overlap.
+    """
+    dataset_pattern = compile_substring_pattern(tuple(datasets))
+    dataset_match = dataset_pattern.search(file) if dataset_pattern is not None else None
+    if not dataset_match:
+        return file
+    dataset_key = dataset_match.group(1)
+    model_name = extract_model_from_filename(file, dataset=dataset_key, verbose=False)
+    if not model_name:
+        return file
+    return (datasets[dataset_key], model_name)
+
+
+def process_file_group_worker(Session, files, datasets, prompt_id, input_dir_base, exclude, verbose=True):
+    """
+    Runs process_file_worker for each file of one (hospital, model) group, one after the other.
+    Files of the same group write the same cases and model, so running them concurrently would
+    race on the existence check in add_llm_diagnoses_batch; different groups run in parallel.
+    Returns a list of (file, process_file result) pairs.
+    """
+    return [
+        (file, process_file_worker(Session, file, datasets, prompt_id, input_dir_base, exclude, verbose=verbose))
+        for file in files
+    ]
 
 
-session = get_session()
+# One pooled engine shared by all workers: a connection per worker, checked before reuse
+engine, session = get_session(get_engine=True, engine_kwargs={"pool_size": MAX_WORKERS, "pool_pre_ping": True})
+Session = sessionmaker(bind=engine)
 prompt_name = "dxgpt_prompt"
 prompt_id = insert_or_fetch_prompt(session, prompt_name, verbose=False) # Keep internal verbose off
+session.close()
 INPUT_DIR_BASE = os.path.join('..', '..','data' ,'dxgpt_testing-main','data')
 pattern = "diagnoses_*.csv"
 # Pass verbose=True to get_files to have the file list logged
@@ -184,36 +313,48 @@ total_llm_diagnosis = 0
 total_diagnosis_rank = 0
 # Use log_message for start message
 log_message(f"\nStarting processing of {len(files)} files...")
+# Files of the same (hospital, model) go to one worker, in order; the groups are
+# independent, so their DB round trips are overlapped across worker threads
+file_groups = {}
 for file in files:
-    llm_added, rank_added, processed_model, processed_dataset = process_file(
-        file,
-        datasets,
-        session,
-        prompt_id,
-        INPUT_DIR_BASE,
-        exclude,
-        verbose=True # Control processing verbosity and logging inside process_file
-    )
-
-    if processed_model and processed_dataset:
-        # Use log_message for per-file summary
-        summary_line1 = f"  -> Finished '{file}': Model='{processed_model}', Dataset='{processed_dataset}', Prompt='{prompt_name}'"
-        summary_line2 = f"     Diagnoses Processed: {llm_added}, Ranks Added: {rank_added}"
-        log_message(summary_line1)
-        log_message(summary_line2)
-    elif llm_added == 0 and rank_added == 0 and not processed_model:
-         # If the file was skipped entirely, a message was already logged inside process_file if verbose=True
-         pass
-
-
-    total_llm_diagnosis += llm_added
-    total_diagnosis_rank += rank_added
+    file_groups.setdefault(file_group_key(file, datasets), []).append(file)
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    futures = [
+        executor.submit(
+            process_file_group_worker,
+            Session,
+            group_files,
+            datasets,
+            prompt_id,
+            INPUT_DIR_BASE,
+            exclude,
+            verbose=True # Control processing verbosity and logging inside process_file
+        )
+        for group_files in file_groups.values()
+    ]
+    for future in as_completed(futures):
+        for file, (llm_added, rank_added, processed_model, processed_dataset) in future.result():
+
+            if processed_model and processed_dataset:
+                # Use log_message for per-file summary
+                summary_line1 = f"  -> Finished '{file}': Model='{processed_model}', Dataset='{processed_dataset}', Prompt='{prompt_name}'"
+                summary_line2 = f"     Diagnoses Processed: {llm_added}, Ranks Added: {rank_added}"
+                log_message(summary_line1)
+                log_message(summary_line2)
+            elif llm_added == 0 and rank_added == 0 and not processed_model:
+                 # If the file was skipped entirely, a message was already logged inside process_file if verbose=True
+                 pass
+
+
+            total_llm_diagnosis += llm_added
+            total_diagnosis_rank += rank_added
+        flush_log() # Once per group rather than once per logged line
 
 # Use log_message for final summary
 log_message(f"\nProcessing complete.")
 log_message(f"Total LLM diagnoses processed across all files: {total_llm_diagnosis}")
 log_message(f"Total diagnosis ranks added across all files: {total_diagnosis_rank}")
 log_message(f"--- Run Finished: {datetime.datetime.now()} ---")
+flush_log()
 
-# session.close() # Consider closing the session
-    
\ No newline at end of file
+engine.dispose()
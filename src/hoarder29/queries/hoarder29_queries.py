@@ -1,25 +1,63 @@
 from db.db_queries import get_model_id, add_model, get_prompt_id, add_prompt
 from db.bench29.bench29_models import CasesBench, CasesBenchMetadata, LlmDifferentialDiagnosis, DifferentialDiagnosis2Rank, CasesBenchDiagnosis
+from sqlalchemy import insert, select, tuple_
 import datetime  # Add this line
 
 
+# Model/prompt IDs resolved so far, keyed on (engine, alias). IDs are database-wide,
+# so the cache is shared by every session bound to the same engine. add_model and
+# add_prompt commit their row immediately, so a later rollback cannot invalidate an entry.
+_MODEL_ID_CACHE = {}
+_PROMPT_ID_CACHE = {}
+
 def insert_or_fetch_model(session, model_name, verbose=False):
+    key = (session.get_bind(), model_name)
+    model_id = _MODEL_ID_CACHE.get(key)
+    if model_id is not None:
+        return model_id
     model_id = get_model_id(session, model_name)
     if not model_id:
         if verbose:
             print(f"Model {model_name} not found in database, creating it")
         model_id = add_model(session, model_name)
-    
+    if model_id is not None:
+        _MODEL_ID_CACHE[key] = model_id
     return model_id
 
 def insert_or_fetch_prompt(session, prompt_name = "dxgpt_prompt", verbose=False):
+    key = (session.get_bind(), prompt_name)
+    prompt_id = _PROMPT_ID_CACHE.get(key)
+    if prompt_id is not None:
+        return prompt_id
     prompt_id = get_prompt_id(session, prompt_name)
     if not prompt_id:
         if verbose:
             print("Standard prompt not found in database, creating it")
         prompt_id = add_prompt(session, prompt_name)
+    if prompt_id is not None:
+        _PROMPT_ID_CACHE[key] = prompt_id
     return prompt_id
 
+def get_case_ids_by_source_file_path(session, hospital, source_file_paths):
+    """
+    Map source_file_path -> CasesBench ID for the cases of one hospital, in a single query.
+
+    Args:
+        session: SQLAlchemy session
+        hospital: Hospital (dataset) name the cases belong to
+        source_file_paths: Iterable of source_file_path values to look up
+
+    Returns:
+        dict: {source_file_path: case_id}; paths without a case are absent.
+            If several cases share a path, the lowest ID wins (as with a first() lookup ordered by id).
+    """
+    rows = session.execute(
+        select(CasesBench.source_file_path, CasesBench.id)
+        .where(CasesBench.hospital == hospital, CasesBench.source_file_path.in_(list(source_file_paths)))
+        .order_by(CasesBench.id.desc())
+    )
+    return dict(rows.all())
+
 def add_llm_diagnosis_to_db(session, case_id, model_id, prompt_id, diagnosis_text, timestamp=None, verbose=False):
     """
     Add a record to the LlmDifferentialDiagnosis table.
@@ -62,13 +100,14 @@ def add_llm_diagnosis_to_db(session, case_id, model_id, prompt_id, diagnosis_tex
     )
     
     session.add(new_diagnosis)
+    session.flush()  # Flush to get the ID before commit expires the instance
+    new_diagnosis_id = new_diagnosis.id
     session.commit()
-    session.flush()  # Flush to get the ID
     
     if verbose:
         print(f"    Added diagnosis for case ID {case_id}")
     
-    return new_diagnosis.id
+    return new_diagnosis_id
 
 def add_diagnosis_rank_to_db(session, case_id, differential_diagnosis_id, rank, diagnosis_name, reasoning, verbose=False):
     """
@@ -114,4 +153,124 @@ def add_diagnosis_rank_to_db(session, case_id, differential_diagnosis_id, rank,
     if verbose:
         print(f"    Added rank {rank} for diagnosis ID {differential_diagnosis_id}")
     
-    return True
\ No newline at end of file
+    return True
+
+
+def add_llm_diagnoses_batch(session, diagnoses, timestamp=None, commit=True, verbose=False):
+    """
+    Add a batch of LlmDifferentialDiagnosis records and their ranks in one transaction.
+
+    Equivalent to calling add_llm_diagnosis_to_db and add_diagnosis_rank_to_db per
+    item, but with a fixed number of statements per batch: one SELECT for the
+    diagnoses that already exist, one multi-row INSERT ... RETURNING for the new
+    ones, one SELECT for the ranks already stored under existing diagnoses and
+    one executemany INSERT for the missing ranks, followed by a single commit
+    (unless commit=False).
+
+    Args:
+        session: SQLAlchemy session
+        diagnoses: List of dicts with keys 'cases_bench_id', 'model_id', 'prompt_id',
+            'diagnosis' and 'ranks' (list of (rank, diagnosis_name, reasoning) tuples)
+        timestamp: Optional timestamp for the new diagnoses (defaults to current time)
+        commit: Whether to commit the batch (rolled back on error). With False the rows
+            are only flushed and the caller owns the transaction.
+        verbose: Whether to print debug information
+
+    Returns:
+        tuple: (number of diagnoses inserted, number of ranks inserted)
+    """
+    if not diagnoses:
+        return 0, 0
+    if timestamp is None:
+        timestamp = datetime.datetime.now()
+
+    def key_of(item):
+        return (item['cases_bench_id'], item['model_id'], item['prompt_id'])
+
+    try:
+        # Diagnoses that already exist keep their id, like add_llm_diagnosis_to_db
+        keys = list({key_of(item) for item in diagnoses})
+        diagnosis_ids = dict(
+            ((row.cases_bench_id, row.model_id, row.prompt_id), row.id)
+            for row in session.execute(
+                select(
+                    LlmDifferentialDiagnosis.id,
+                    LlmDifferentialDiagnosis.cases_bench_id,
+                    LlmDifferentialDiagnosis.model_id,
+                    LlmDifferentialDiagnosis.prompt_id
+                ).where(
+                    tuple_(
+                        LlmDifferentialDiagnosis.cases_bench_id,
+                        LlmDifferentialDiagnosis.model_id,
+                        LlmDifferentialDiagnosis.prompt_id
+                    ).in_(keys)
+                )
+            )
+        )
+        existing_diagnosis_ids = set(diagnosis_ids.values())
+
+        new_rows = {}
+        for item in diagnoses:
+            key = key_of(item)
+            if key not in diagnosis_ids and key not in new_rows:
+                new_rows[key] = {
+                    'cases_bench_id': item['cases_bench_id'],
+                    'model_id': item['model_id'],
+                    'prompt_id': item['prompt_id'],
+                    'diagnosis': item['diagnosis'],
+                    'timestamp': timestamp
+                }
+        if new_rows:
+            inserted = session.execute(
+                insert(LlmDifferentialDiagnosis).values(list(new_rows.values())).returning(
+                    LlmDifferentialDiagnosis.id,
+                    LlmDifferentialDiagnosis.cases_bench_id,
+                    LlmDifferentialDiagnosis.model_id,
+                    LlmDifferentialDiagnosis.prompt_id
+                )
+            )
+            for row in inserted:
+                diagnosis_ids[(row.cases_bench_id, row.model_id, row.prompt_id)] = row.id
+
+        # Only ranks under pre-existing diagnoses can already be stored
+        existing_ranks = set()
+        if existing_diagnosis_ids:
+            existing_ranks = set(tuple(row) for row in session.execute(
+                select(
+                    DifferentialDiagnosis2Rank.cases_bench_id,
+                    DifferentialDiagnosis2Rank.differential_diagnosis_id,
+                    DifferentialDiagnosis2Rank.rank_position
+                ).where(DifferentialDiagnosis2Rank.differential_diagnosis_id.in_(existing_diagnosis_ids))
+            ))
+
+        rank_rows = []
+        for item in diagnoses:
+            diagnosis_id = diagnosis_ids[key_of(item)]
+            for rank, diagnosis_name, reasoning in item['ranks']:
+                rank_key = (item['cases_bench_id'], diagnosis_id, rank)
+                if rank_key in existing_ranks:
+                    if verbose:
+                        print(f"    Rank {rank} already exists for diagnosis ID {diagnosis_id}, skipping")
+                    continue
+                existing_ranks.add(rank_key)
+                rank_rows.append({
+                    'cases_bench_id': item['cases_bench_id'],
+                    'differential_diagnosis_id': diagnosis_id,
+                    'rank_position': rank,
+                    'predicted_diagnosis': diagnosis_name,
+                    'reasoning': reasoning
+                })
+        if rank_rows:
+            session.execute(insert(DifferentialDiagnosis2Rank), rank_rows)
+
+        if commit:
+            session.commit()
+    except Exception:
+        if commit:
+            session.rollback()
+        raise
+
+    if verbose:
+        print(f"    Added {len(new_rows)} diagnoses and {len(rank_rows)} ranks ({len(diagnoses) - len(new_rows)} diagnoses already existed)")
+
+    return len(new_rows), len(rank_rows)
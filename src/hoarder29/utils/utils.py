@@ -1,5 +1,7 @@
 import os
+import functools
 
+@functools.lru_cache(maxsize=None)
 def extract_model_from_filename(filename, prefix="diagnoses", 
 dataset="_PUMCH_ADAM_", verbose=True, deep_verbose=False):
     """
@@ -10,12 +12,14 @@ dataset="_PUMCH_ADAM_", verbose=True, deep_verbose=False):
         prefix: Expected prefix for the filename (default: diagnoses)
         dataset: Expected dataset identifier (default: _PUMCH_ADAM_)
         verbose: Whether to print detailed information (default: True)
+        deep_verbose: Whether to print every parsing step (default: False)
         
     Returns:
         str: Model name or None if pattern doesn't match
+    
+    Results are memoized per argument tuple, so a filename is only parsed once.
     """
     # Remove file extension if present
-    deep_verbose = True
     if deep_verbose:
         print(f"Processing filename: {filename}")
         
@@ -14,6 +14,25 @@ import re
 from string import Formatter
 
 
+def make_single_placeholder_renderer(prefix: str, suffix: str) -> Callable[[Any], str]:
+	"""
+	Build a renderer for a template of the form prefix + {placeholder} + suffix.
+	
+	The literal parts are bound once, so every render is two concatenations
+	and the same prefix object is reused across calls.
+	
+	Args:
+		prefix: Literal text before the placeholder
+		suffix: Literal text after the placeholder
+		
+	Returns:
+		Function taking the placeholder value and returning the prompt
+	"""
+	def render(value) -> str:
+		return prefix + str(value) + suffix
+	return render
+
+
 class PromptBuilder(ABC):
 	"""
 	Base class for building prompt templates.
@@ -33,6 +52,8 @@ class PromptBuilder(ABC):
 		self.sections = {}  # Will store loaded section content
 		self.meta_template = ""  # Template string with placeholders
 		self.prompt_template = None  # Will store the partial function
+		self._render_parts = None  # Preparsed [literal, field, literal, field, ...] of prompt_template
+		self._render_single = None  # Specialized renderer for templates with a single placeholder
 	
 	def load_section_from_db(self, section_name: str, prompt_alias: Optional[str] = None, prompt_id: Optional[int] = None):
 		"""
@@ -225,6 +246,8 @@ class PromptBuilder(ABC):
 		
 		# Do the formatting
 		self.prompt_template = self.prompt_template.format(**format_dict)
+		self._render_parts = None  # Template changed, placeholders must be parsed again
+		self._render_single = None
 		
 		# debug = True
 		if debug:
@@ -263,9 +286,46 @@ class PromptBuilder(ABC):
 		# Populate the template with sections
  
 		self.prompt_template = self.build_partial_template(**self.sections)
+		self.compile_render_parts()
 
 		return self.prompt_template
 
+	def compile_render_parts(self):
+		"""
+		Preparse the built template once so that rendering does not go through str.format.
+		
+		Splits prompt_template into alternating literal text and placeholder
+		names, e.g. ["Symptoms: ", "description", ""]. Escaped braces are
+		already resolved in the literals. Templates using conversions or
+		format specs are left to str.format (render parts set to None).
+		
+		When the template has exactly one placeholder (the usual case, e.g.
+		"{description}"), it is also partially evaluated into a renderer that
+		only concatenates the fixed prefix, the text and the fixed suffix.
+		
+		Returns:
+			List of render parts, or None if the template cannot be preparsed
+		"""
+		parts = []
+		literal = ""
+		self._render_single = None
+		for literal_text, field_name, format_spec, conversion in Formatter().parse(self.prompt_template):
+			# Escaped braces split the literal text, so merge it until the next placeholder
+			literal += literal_text
+			if field_name is None:
+				continue
+			if format_spec or conversion:
+				self._render_parts = None
+				return None
+			parts.append(literal)
+			parts.append(field_name)
+			literal = ""
+		parts.append(literal)
+		self._render_parts = parts
+		if len(parts) == 3:
+			self._render_single = make_single_placeholder_renderer(parts[0], parts[2])
+		return parts
+
 
 
 	def to_prompt(self, text: str = None, kwargs: dict = None): 
@@ -282,18 +342,26 @@ class PromptBuilder(ABC):
 			if self.verbose:
 				print("Template not built yet, building now")
 			self.build_template()
+		parts = self._render_parts
+		if parts is None:
+			parts = self.compile_render_parts()
+		if not kwargs and self._render_single is not None:
+			return self._render_single(text)
 		if not kwargs:
-			placeholders = self.get_placeholder_names()
+			# Placeholders were checked once when the template was preparsed
+			placeholders = list(set(parts[1::2])) if parts is not None else self.get_placeholder_names()
 			if len(placeholders) != 1:
 				raise ValueError(f"""WARNING: you have more than one placeholder in your template,
 				placeholder list: {placeholders} """)
 			placeholder = placeholders[0]
 			kwargs = {placeholder:text}
-			verbose = True
-			if verbose:
+			if self.verbose:
 				print(f"kwargs: {kwargs}")
-		# Format with the given parameters
-		return self.prompt_template.format(**kwargs)
+		if parts is None:
+			# Format with the given parameters
+			return self.prompt_template.format(**kwargs)
+		# Odd positions hold placeholder names, even positions literal text
+		return "".join([part if i % 2 == 0 else str(kwargs[part]) for i, part in enumerate(parts)])
 	
 	def reset(self):
 		"""
@@ -305,6 +373,8 @@ class PromptBuilder(ABC):
 		self.sections = {}
 		self.meta_template = ""
 		self.prompt_template = None
+		self._render_parts = None
+		self._render_single = None
 		return self
 	
 	@abstractmethod
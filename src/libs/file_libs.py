@@ -1,6 +1,10 @@
+import functools
 import os
 import re
 
+# "{model}_diagnosis_{prompt}" or "{model}_diagnosis" directory names, compiled once at import
+MODEL_PROMPT_DIR_RE = re.compile(r"(.+)_diagnosis(?:_(.+))?")
+
 def get_directories(dirname, verbose=False):
     """
     List all directories in the specified path.
@@ -15,7 +19,8 @@ def get_directories(dirname, verbose=False):
     if verbose:
         print("Listing directories...")
     
-    dirs = [d for d in os.listdir(dirname) if os.path.isdir(os.path.join(dirname, d))]
+    # One directory scan; DirEntry.is_dir() reuses the type from the listing instead of a stat per entry
+    dirs = [entry.name for entry in os.scandir(dirname) if entry.is_dir()]
     
     if verbose:
         print(f"Found {len(dirs)} directories")
@@ -73,10 +78,12 @@ def filter_files(dir_path, extensions=None, prefixes=None, suffixes=None, verbos
     
     return filtered_files
 
+@functools.lru_cache(maxsize=4096)
 def extract_model_prompt(dirname):
     """
     Extract model and prompt from directory name formatted as
     "{model}_diagnosis_{prompt}" or "{model}_diagnosis".
+    Memoized: the same directory names are parsed again by every script.
     
     Args:
         dirname: Directory name to parse
@@ -84,8 +91,7 @@ def extract_model_prompt(dirname):
     Returns:
         Tuple of (model_name, prompt_name) or (None, None) if not matched
     """
-    pattern = r"(.+)_diagnosis(?:_(.+))?"
-    match = re.match(pattern, dirname)
+    match = MODEL_PROMPT_DIR_RE.match(dirname)
     if match:
         model_name = match.group(1)
         prompt_name = match.group(2) if match.group(2) else "standard"
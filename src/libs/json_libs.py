@@ -5,6 +5,14 @@ JSON utility functions for loading, parsing, and manipulating JSON data.
 import json
 import os
 
+# orjson is optional: when installed, load_json decodes UTF-8 files with it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
 
 
 def parse_json(text):
@@ -118,6 +126,26 @@ def parse_json(text):
     return "", {}
 
 
+def read_json_file(file_path, encoding='utf-8'):
+    """
+    Decode a JSON file, with orjson when it is installed and the encoding is UTF-8.
+    orjson does not accept a BOM, so it is stripped for 'utf-8-sig'. Documents
+    orjson rejects but the stdlib accepts (NaN, integers beyond 64 bits) fall
+    back to json.loads, so the result never depends on which decoder ran.
+    Unlike load_json, errors are raised to the caller.
+    """
+    if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8', 'utf-8-sig'):
+        with open(file_path, 'r', encoding=encoding) as f:
+            return json.load(f)
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    if encoding.lower().replace('_', '-') == 'utf-8-sig' and raw.startswith(UTF8_BOM):
+        raw = raw[len(UTF8_BOM):]
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return json.loads(raw.decode('utf-8'))
+
 def load_json(file_path_or_text, encoding='utf-8', verbose=False):
     """
     Load and parse a JSON file with specified encoding.
@@ -139,8 +167,7 @@ def load_json(file_path_or_text, encoding='utf-8', verbose=False):
                 print(f"Loading JSON file: {file_path}")
 
 
-        with open(file_path, 'r', encoding=encoding) as f:
-            data = json.load(f)
+        data = read_json_file(file_path, encoding)
             
         if verbose:
             print(f"Successfully loaded JSON from {file_path}")
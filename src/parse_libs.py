@@ -1,5 +1,8 @@
 import re
 
+# Numbered line such as "1. name" or "2) name", compiled once at import
+NUMBERED_LINE_RE = re.compile(r'^\s*(\d+)[\.\)\-]?\s*(.+)')
+
 def parse_diagnosis_text(diagnosis_text, verbose=False, deep_verbose=False):
     """
     Parse diagnosis text to extract rank, diagnosis, and reasoning.
@@ -24,10 +27,10 @@ def parse_diagnosis_text(diagnosis_text, verbose=False, deep_verbose=False):
             print("Empty diagnosis text, returning None values")
         return None, None, None
     
-    # Split the text into lines
-    lines = diagnosis_text.strip().split('\n')
+    # Split the text into lines, stripping each line once and dropping blank ones
+    lines = [line for line in (raw.strip() for raw in diagnosis_text.splitlines()) if line]
     if verbose:
-        print(f"Split text into {len(lines)} lines")
+        print(f"Split text into {len(lines)} non-empty lines")
     
     # Try to find a numbered diagnosis
     rank_position = None
@@ -35,17 +38,9 @@ def parse_diagnosis_text(diagnosis_text, verbose=False, deep_verbose=False):
     reasoning_lines = []
     
     for i, line in enumerate(lines):
-        line = line.strip()
-        if not line:
-            continue
-        
         # Check if this line starts with a number (like "1." or "1)")
-        try:
-            number_match = re.match(r'^\s*(\d+)[\.\)\-]?\s*(.+)', line)
-        except Exception as e:
-            if verbose:
-                print(f"Error during regex matching for line {i+1}: {str(e)}")
-            continue
+        # The line is stripped, so a numbered line must start with a digit; others skip the regex
+        number_match = NUMBERED_LINE_RE.match(line) if line[0].isdigit() else None
             
         if number_match:
             # Found a numbered line, likely a diagnosis
@@ -59,74 +54,41 @@ def parse_diagnosis_text(diagnosis_text, verbose=False, deep_verbose=False):
             diagnosis_text = number_match.group(2).strip()
             
             # Check if diagnosis has a colon separating diagnosis and reasoning
-            try:
-                colon_parts = diagnosis_text.split(':', 1)
-            except Exception as e:
-                if verbose:
-                    print(f"Error splitting by colon: {str(e)}")
-                diagnosis_name = diagnosis_text
-                break
+            colon_parts = diagnosis_text.split(':', 1)
                 
             if len(colon_parts) > 1 and len(colon_parts[1].strip()) > 0:
                 # There's a non-empty part after the colon, treat it as reasoning
                 diagnosis_name = colon_parts[0].strip()
                 reasoning_lines.append(colon_parts[1].strip())
-                
-                # We found a diagnosis, now collect the rest as reasoning
-                for j in range(i+1, len(lines)):
-                    if lines[j].strip():
-                        reasoning_lines.append(lines[j].strip())
             else:
                 # No colon or empty part after colon, the whole text is the diagnosis
                 diagnosis_name = diagnosis_text
-                
-                # We found a diagnosis, now collect the rest as reasoning
-                for j in range(i+1, len(lines)):
-                    if lines[j].strip():
-                        reasoning_lines.append(lines[j].strip())
+
+            # We found a diagnosis, now collect the rest as reasoning
+            reasoning_lines.extend(lines[i+1:])
             
             break  # We found our diagnosis, stop processing lines
             
     # If we didn't find a numbered diagnosis, try to use the first line
     if diagnosis_name is None and lines:
-        try:
-            # Try to parse it as a single diagnosis
-            first_line = lines[0].strip()
-            colon_parts = first_line.split(':', 1)
-            
-            if len(colon_parts) > 1 and len(colon_parts[1].strip()) > 0:
-                diagnosis_name = colon_parts[0].strip()
-                reasoning_lines.append(colon_parts[1].strip())
-                
-                # Add remaining lines as reasoning
-                for j in range(1, len(lines)):
-                    if lines[j].strip():
-                        reasoning_lines.append(lines[j].strip())
-            else:
-                # No colon, use the entire first line as diagnosis
-                diagnosis_name = first_line
-                
-                # Add remaining lines as reasoning
-                for j in range(1, len(lines)):
-                    if lines[j].strip():
-                        reasoning_lines.append(lines[j].strip())
-                        
-            rank_position = 1  # Default rank if not numbered
-            
-        except Exception as e:
-            if verbose:
-                print(f"Error parsing first line as diagnosis: {str(e)}")
-            return None, None, None
+        # Try to parse it as a single diagnosis
+        first_line = lines[0]
+        colon_parts = first_line.split(':', 1)
+        
+        if len(colon_parts) > 1 and len(colon_parts[1].strip()) > 0:
+            diagnosis_name = colon_parts[0].strip()
+            reasoning_lines.append(colon_parts[1].strip())
+        else:
+            # No colon, use the entire first line as diagnosis
+            diagnosis_name = first_line
+
+        # Add remaining lines as reasoning
+        reasoning_lines.extend(lines[1:])
+                    
+        rank_position = 1  # Default rank if not numbered
     
     # Join reasoning lines into a single string
-    reasoning = None
-    if reasoning_lines:
-        try:
-            reasoning = "\n".join(reasoning_lines)
-        except Exception as e:
-            if verbose:
-                print(f"Error joining reasoning lines: {str(e)}")
-            reasoning = None
+    reasoning = "\n".join(reasoning_lines) if reasoning_lines else None
     
     if verbose:
         print("\nPARSING RESULT:")